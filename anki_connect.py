@@ -1,18 +1,91 @@
-import requests
+import asyncio
+import httpx
 import base64
-from PIL import Image
-from io import BytesIO
 import threading
+import time
 import os
+import re
 import configparser  # 新增导入配置解析库
+from urllib.parse import urlparse
+from audio_cache import AudioCache
+from audio_fetcher import HttpAudioFetcher
+from image_utils import ImageCompressor
+from media_manifest import MediaManifest, media_filename
+from metrics import metrics
+from note_index import NoteIndex, normalize_word
+
+
+class AnkiClient:
+    """AnkiConnect异步HTTP客户端：keep-alive连接池（最多pool_size个连接）、连接/读取超时及各动作耗时统计
+
+    httpx.AsyncClient在首次请求时创建，之后只能在同一个事件循环中使用（见pipeline.EventLoopThread）。
+    """
+
+    def __init__(self, url="http://localhost:8765", connect_timeout=3.0, read_timeout=30.0, pool_size=8):
+        self.url = url
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.session = None
+        self.metrics = {}  # 动作名 -> {"count", "errors", "total", "max"}
+        self.lock = threading.Lock()  # stats()可能在其他线程中调用
+
+    async def request(self, action, **params):
+        """发送请求到AnkiConnect，连接失败或超时返回None"""
+        if self.session is None:
+            self.session = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        request_data = {
+            'action': action,
+            'version': 6,
+            'params': params
+        }
+        # multi请求按其中的动作分别统计（如anki.multi.findNotes），便于区分查询和更新
+        span_name = f"anki.{action}"
+        span_attrs = {}
+        if action == 'multi' and params.get('actions'):
+            span_name = f"anki.multi.{params['actions'][0]['action']}"
+            span_attrs['count'] = len(params['actions'])
+        elif action in ('addNotes', 'notesInfo'):
+            span_attrs['count'] = len(params.get('notes') or [])
+        start = time.perf_counter()
+        error = False
+        with metrics.span(span_name, **span_attrs) as span:
+            try:
+                response = await self.session.post(self.url, json=request_data)
+                return response.json()
+            except Exception as e:
+                error = True
+                span['error'] = str(e)
+                print(f"连接错误: 无法连接Anki: {str(e)}")
+                return None
+            finally:
+                self._record(action, time.perf_counter() - start, error)
+
+    async def aclose(self):
+        if self.session is not None:
+            await self.session.aclose()
+            self.session = None
+
+    def _record(self, action, elapsed, error):
+        with self.lock:
+            stat = self.metrics.setdefault(action, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0})
+            stat["count"] += 1
+            stat["errors"] += int(error)
+            stat["total"] += elapsed
+            stat["max"] = max(stat["max"], elapsed)
+
+    def stats(self):
+        """返回各动作的调用次数、失败次数及平均/最大耗时（秒）"""
+        with self.lock:
+            return {
+                action: dict(stat, avg=stat["total"] / stat["count"])
+                for action, stat in self.metrics.items()
+            }
+
 
 class AnkiConnect:
-    def __init__(self, openai_client=None):
-        self.openai_client = openai_client  # 接收OpenAI客户端实例
+    def __init__(self):
         self.folder_path = ""  # 图片文件夹路径（由main.py动态设置）
         self.voice_url = ""
-        self.cards_name = ""
-        self.mode = ""
         
         # 新增：读取Anki相关配置
         config = configparser.ConfigParser()
@@ -27,7 +100,42 @@ class AnkiConnect:
         self.max_width = config.getint("anki", "max_width")  # 新增：读取最大宽度（整数）
         self.max_height = config.getint("anki", "max_height")  # 新增：读取最大高度（整数）
         self.image_quality = config.getint("anki", "image_quality")  # 新增：读取压缩质量（整数）
-
+        # 新增：打开文件夹时在后台预压缩截图，结果保存在compressed_dir中
+        self.precompress_enabled = config.getboolean("anki", "precompress", fallback=True)
+        compressed_dir = config.get("anki", "compressed_dir", fallback="cache/compressed")
+        if not os.path.isabs(compressed_dir):
+            compressed_dir = os.path.join(os.path.dirname(__file__), compressed_dir)
+        # 新增：图片压缩进程池（compress_workers为0时使用全部CPU核心）
+        self.compressor = ImageCompressor(
+            self.max_width, self.max_height, self.image_quality,
+            max_workers=config.getint("anki", "compress_workers", fallback=0),
+            staging_dir=compressed_dir if self.precompress_enabled else None,
+            background_workers=config.getint("anki", "precompress_workers", fallback=1)
+        )
+        self.compressor.prune_staged()
+        # 新增：已上传图片清单（同一截图不再重复压缩和上传）
+        self.media_manifest = MediaManifest.from_config(config)
+        self.compress_settings = self.compressor.settings
+        self.media_verify = {}  # 文件名模式 -> 与媒体库核对上传记录的asyncio.Task，同时使用记录的请求共用
+
+
+        # 新增：AnkiConnect连接配置
+        self.client = AnkiClient(
+            url=config.get("anki", "url", fallback="http://localhost:8765"),
+            connect_timeout=config.getfloat("anki", "connect_timeout", fallback=3.0),
+            read_timeout=config.getfloat("anki", "read_timeout", fallback=30.0),
+            pool_size=config.getint("anki", "pool_size", fallback=8)
+        )
+        # 新增：图片上传方式。path为先写入暂存目录再只传文件路径（要求Anki与本程序在同一台电脑），
+        # base64为把图片编码后放在请求中；auto在AnkiConnect地址为本机时使用path
+        self.media_transfer = config.get("anki", "media_transfer", fallback="auto").strip().lower()
+        if self.media_transfer == "auto":
+            host = urlparse(self.client.url).hostname
+            self.media_transfer = "path" if host in ("localhost", "127.0.0.1", "::1") else "base64"
+        staging_dir = config.get("anki", "media_staging_dir", fallback="cache/media_staging")
+        if not os.path.isabs(staging_dir):
+            staging_dir = os.path.join(os.path.dirname(__file__), staging_dir)
+        self.media_staging_dir = staging_dir
 
         self.fields = {
             "word": config.get("anki", "word_field"),
@@ -39,250 +147,421 @@ class AnkiConnect:
         }
 
 
-        self.set_mode('jp')  # 初始化默认模式
-
-    def set_mode(self, newmode):
-        self.mode = newmode
-        # 修改：使用配置文件中的值
-        if self.mode == 'jp':
-            self.cards_name = self.jp_deck
-        elif self.mode == 'en':
-            self.cards_name = self.en_deck
-
-    def make_voice_url(self, word, pronun):
-        if (self.mode == 'jp'):
-            return f'[sound:https://assets.languagepod101.com/dictionary/japanese/audiomp3.php?kanji={word}&kana={pronun}]'
-        elif (self.mode == 'en'):
-            return f'[sound:https://dict.youdao.com/dictvoice?audio={word}]'
-
-    def anki_request(self, action, **params):
-        """发送请求到AnkiConnect"""
-        request_data = {
-            'action': action,
-            'version': 6,
-            'params': params
-        }
+        # 新增：本地单词索引（关闭时每张卡片仍用findNotes查询）
+        self.note_index = None
+        if config.getboolean("anki", "note_index", fallback=True):
+            self.note_index = NoteIndex(
+                self.client, self.fields["word"],
+                resync_interval=config.getfloat("anki", "index_resync_interval", fallback=60.0)
+            )
+        self.write_lock = None  # 新增：串行化笔记写入（asyncio.Lock，在事件循环中创建）
+
+        # 新增：单词发音下载到本地缓存后上传到媒体库，卡片中引用本地文件；未启用或下载失败时仍使用在线地址
+        self.audio_fetcher = HttpAudioFetcher.from_config(config)
+        self.audio_cache = AudioCache.from_config(config)
+        self.audio_max_concurrent = config.getint("audio", "max_concurrent", fallback=4)
+        self.audio_limit = None  # 同时下载的发音数量（asyncio.Semaphore，在事件循环中创建）
+        self.audio_tasks = {}  # 缓存键 -> 进行中的asyncio.Task，同一发音只下载和上传一次
+        # 发音来源连续failure_threshold次无法访问后，retry_after秒内不再下载（直接使用在线地址），避免每张卡片都等待超时
+        self.audio_failure_threshold = max(1, config.getint("audio", "failure_threshold", fallback=3))
+        self.audio_retry_after = config.getfloat("audio", "retry_after", fallback=300)
+        self.audio_failures = 0
+        self.audio_unavailable_until = 0.0
+
+    def deck_for(self, mode):
+        """返回语言模式对应的牌组（使用配置文件中的值）"""
+        # 修改：模式随每张卡片传入，不再保存为共享状态，同一批次可同时包含日语和英语卡片
+        if mode == 'jp':
+            return self.jp_deck
+        elif mode == 'en':
+            return self.en_deck
+        raise ValueError(f"未知的语言模式：{mode}")
+
+    def make_voice_url(self, word, pronun, mode):
+        """在线发音地址（未启用发音缓存或下载失败时使用）"""
+        url = self.audio_fetcher.url(word, pronun, mode, escape=False)
+        return f'[sound:{url}]' if url else ''
+
+    async def store_audio(self, word, pronunciation, mode):
+        """下载单词发音并上传到Anki媒体库，返回媒体文件名；未启用或无法获取时返回None
+
+        同时请求同一发音的多张卡片共用一次下载和上传，可在解析其他单词、上传图片的同时进行。
+        """
+        if not self.audio_cache:
+            return None
+        key = self.audio_fetcher.cache_key(word, pronunciation, mode)
+        if key is None:
+            return None
+        task = self.audio_tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._store_audio(key, word, pronunciation, mode))
+            self.audio_tasks[key] = task
+            task.add_done_callback(lambda _: self.audio_tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _store_audio(self, key, word, pronunciation, mode):
         try:
-            response = requests.post('http://localhost:8765', json=request_data)
-            return response.json()
+            data = None
+            cached = self.audio_cache.lookup(key)
+            if cached is not None:
+                filename, path = cached
+                if filename is None:
+                    return None  # 最近确认过没有发音
+            else:
+                if self.audio_limit is None:
+                    self.audio_limit = asyncio.Semaphore(max(1, self.audio_max_concurrent))
+                async with self.audio_limit:
+                    # 排队期间发音来源可能已被判定为无法访问
+                    if time.monotonic() < self.audio_unavailable_until:
+                        return None
+                    try:
+                        with metrics.span("audio.fetch", word=word, mode=mode):
+                            data = await self.audio_fetcher.fetch(word, pronunciation, mode)
+                    except Exception as e:
+                        self._audio_fetch_failed(word, e)
+                        return None
+                self.audio_failures = 0
+                if not data:
+                    print(f"没有找到发音：{word}")
+                    self.audio_cache.put_missing(key)
+                    return None
+                # 文件名中去掉Windows不允许的字符
+                filename = media_filename(re.sub(r'[\\/:*?"<>|]', '_', word), data, ".mp3")
+                path = await asyncio.get_running_loop().run_in_executor(
+                    None, self.audio_cache.put, key, filename, data
+                )
+
+            if await self._verify_uploaded(self.audio_cache) and self.audio_cache.is_uploaded(filename):
+                return filename
+            with metrics.span("audio.store", file=filename):
+                response = await self._upload_media(filename, data, path=path)
+            if not response or response.get('error'):
+                print(f"上传发音失败: {word} - {response.get('error') if response else '无响应'}")
+                return None
+            self.audio_cache.mark_uploaded(filename)
+            return filename
         except Exception as e:
-            print(f"连接错误: 无法连接Anki: {str(e)}")
+            print(f"获取发音失败: {word} - {e}")
             return None
 
-    def store_media_file(self, filename):
-        """将图片压缩为480p的jpg文件并存储到Anki媒体库"""
+    def _audio_fetch_failed(self, word, error):
+        """记录一次下载失败，连续失败达到上限后暂停下载发音"""
+        print(f"下载发音失败: {word} - {error}")
+        self.audio_failures += 1
+        if self.audio_failures >= self.audio_failure_threshold:
+            self.audio_failures = 0
+            self.audio_unavailable_until = time.monotonic() + self.audio_retry_after
+            print(f"发音来源连续 {self.audio_failure_threshold} 次无法访问，"
+                  f"{self.audio_retry_after:.0f} 秒内改用在线发音地址")
+
+    async def aclose(self):
+        """关闭与AnkiConnect和发音来源的连接池（只能在处理引擎的事件循环中调用）"""
+        await self.client.aclose()
+        # 可替换的发音来源不一定持有连接
+        close = getattr(self.audio_fetcher, "aclose", None)
+        if close:
+            await close()
+
+    async def anki_request(self, action, **params):
+        """发送请求到AnkiConnect（经由共享连接池）"""
+        return await self.client.request(action, **params)
+
+    async def _uploaded_name(self, img_path):
+        """返回该截图按当前压缩参数已上传过的媒体文件名，未上传返回None"""
+        if not self.media_manifest:
+            return None
+        if not await self._verify_uploaded(self.media_manifest):
+            return None  # 未能核对时不信任清单，照常上传
+        return self.media_manifest.lookup(MediaManifest.source_key(img_path, self.compress_settings))
+
+    async def _verify_uploaded(self, records):
+        """每次启动后首次使用上传记录（见media_manifest.UploadedMedia）前，与Anki媒体库的实际文件核对一次，
+        返回记录是否可信；同时使用同一记录的请求共用一次核对"""
+        if records.verified:
+            return True
+        task = self.media_verify.get(records.pattern)
+        if task is None or task.done():
+            task = self.media_verify[records.pattern] = asyncio.ensure_future(self._check_uploaded(records))
+        await asyncio.shield(task)
+        return records.verified
+
+    async def _check_uploaded(self, records):
+        response = await self.anki_request('getMediaFilesNames', pattern=records.pattern)
+        if response is None:
+            return  # 无法连接Anki，下次使用记录时再核对
+        if not response.get('error') and response.get('result') is not None:
+            removed = records.retain(response['result'])
+            if removed:
+                print(f"有 {removed} 个{records.label}已不在Anki媒体库中，将重新上传")
+        else:
+            # 旧版AnkiConnect不支持该动作时直接信任记录
+            records.verified = True
+
+    def precompress(self, img_paths):
+        """在后台线程中把尚未上传过的截图提交给低优先级的预压缩进程，可在界面线程调用"""
+        if not self.precompress_enabled:
+            return
+
+        def submit():
+            paths = [
+                p for p in img_paths
+                if not (self.media_manifest and self.media_manifest.lookup(
+                    MediaManifest.source_key(p, self.compress_settings)))
+            ]
+            count = self.compressor.precompress(paths)
+            if count:
+                print(f"后台预压缩 {count} 张截图")
+
+        threading.Thread(target=submit, daemon=True).start()
+
+    def cancel_precompress(self):
+        self.compressor.cancel_precompress()
+
+    async def compress_files(self, filenames):
+        """把图片提交到压缩进程池，返回与filenames等长的Future列表（已上传过的图片为None）"""
+        futures = []
+        for f in filenames:
+            img_path = os.path.join(self.folder_path, f)
+            futures.append(None if await self._uploaded_name(img_path) else self.compressor.submit(img_path))
+        return futures
+
+    async def store_media_file(self, filename, compressed=None):
+        """将图片压缩为jpg文件并存储到Anki媒体库
+
+        filename可以是相对folder_path的文件名或绝对路径。
+        compressed为compress_files返回的Future时直接上传其压缩结果，否则在默认线程池中压缩。
+        媒体文件名带内容哈希；同一截图已上传过，或相同内容已在媒体库中时跳过上传。
+        """
         img_path = os.path.join(self.folder_path, filename)
-        base_name = os.path.splitext(filename)[0]
-        compressed_filename = f"{base_name}.jpg"
+        base_name = os.path.splitext(os.path.basename(filename))[0]
 
         try:
-            with Image.open(img_path) as img:
-                # 修改：使用配置文件中的尺寸
-                max_size = (self.max_width, self.max_height)
-                img.thumbnail(max_size)
-
-                if img.mode in ('RGBA', 'LA'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else img.split()[-1])
-                    img = background
-                else:
-                    img = img.convert('RGB')
-
-                img_buffer = BytesIO()
-                # 修改：使用配置文件中的质量参数
-                img.save(img_buffer, format='JPEG', quality=self.image_quality)
-                img_data = img_buffer.getvalue()
-                img_b64 = base64.b64encode(img_data).decode("utf-8")
-
-                response = self.anki_request(
-                    'storeMediaFile',
-                    filename=compressed_filename,
-                    data=img_b64
-                )
-                return {'filename': compressed_filename, 'response': response}
+            uploaded_name = await self._uploaded_name(img_path)
+            if uploaded_name:
+                print(f"图片已在媒体库中，跳过上传: {uploaded_name}")
+                return {'filename': uploaded_name, 'response': {'result': uploaded_name, 'error': None}}
+
+            source_key = MediaManifest.source_key(img_path, self.compress_settings)
+            img_data = None
+            if compressed is not None:
+                try:
+                    img_data = await self.compressor.result(compressed)
+                except Exception as e:
+                    print(f"后台压缩图片失败，改为直接压缩: {img_path} - {e}")
+            if img_data is None:
+                # 修改：使用配置文件中的尺寸和质量参数
+                img_data = await asyncio.get_running_loop().run_in_executor(None, self.compressor.compress, img_path)
+
+            compressed_filename = media_filename(base_name, img_data)
+            if self.media_manifest and self.media_manifest.is_uploaded(compressed_filename):
+                self.media_manifest.put(source_key, compressed_filename)
+                self.compressor.discard(img_path)
+                print(f"相同内容的图片已在媒体库中，跳过上传: {compressed_filename}")
+                return {'filename': compressed_filename, 'response': {'result': compressed_filename, 'error': None}}
+
+            response = await self._upload_media(compressed_filename, img_data)
+            if response and not response.get('error'):
+                if self.media_manifest:
+                    self.media_manifest.put(source_key, compressed_filename)
+                self.compressor.discard(img_path)  # 已上传的截图不再需要预压缩结果
+            return {'filename': compressed_filename, 'response': response}
         except Exception as e:
             print(f"压缩或上传图片失败: {img_path} - {e}")
             return None
 
-    def create_anki_card(self, filename, user_input, btn):
-        """异步创建单张Anki卡片"""
-        def async_task():
-            if not self.openai_client:
-                btn.config(state="normal", text="创建卡片")
-                return
-
-            raw_name = os.path.splitext(filename)[0]
-            result = self.openai_client.explain_single(raw_name, user_input)
-            if result['error']:
-                btn.config(state="normal", text="创建卡片")
-                return
-
-            media_result = self.store_media_file(filename)
-            if not media_result or media_result.get('response', {}).get('error'):
-                btn.config(state="normal", text="创建卡片")
-                return
-
-            compressed_filename = media_result['filename']
-            fields = {
-                self.fields["word"]: result['word'],
-                self.fields["pronunciation"]: result['pronunciation'],
-                self.fields["meaning"]: result['meaning'],
-                self.fields["note"]: result['note'],
-                self.fields["example"]:  f'{result["example"]}<br><img src="{compressed_filename}">',
-                self.fields["voice"]: self.make_voice_url(result['word'], result['pronunciation'])
-            }
+    async def _upload_media(self, compressed_filename, img_data, path=None):
+        """上传媒体文件，path方式失败时改用base64并在本次运行中不再尝试path
+
+        path为已保存在本地的文件（如发音缓存）时按路径上传不再写入暂存目录，img_data可为None。
+        """
+        if self.media_transfer == "path":
+            staged_path = path or os.path.join(self.media_staging_dir, compressed_filename)
+            try:
+                if path is None:
+                    os.makedirs(self.media_staging_dir, exist_ok=True)
+                    with metrics.span("media.stage", bytes=len(img_data)):
+                        with open(staged_path, "wb") as f:
+                            f.write(img_data)
+                response = await self.anki_request('storeMediaFile', filename=compressed_filename, path=staged_path)
+                if response and not response.get('error'):
+                    return response
+                print(f"按路径上传图片失败，改用base64上传: {response.get('error') if response else '无响应'}")
+            except OSError as e:
+                print(f"写入暂存目录失败，改用base64上传: {e}")
+            finally:
+                # AnkiConnect在请求内已把文件复制到媒体库，暂存文件可立即删除
+                if path is None:
+                    try:
+                        os.remove(staged_path)
+                    except OSError:
+                        pass
+            self.media_transfer = "base64"
+
+        if img_data is None:
+            with open(path, "rb") as f:
+                img_data = f.read()
+
+        with metrics.span("media.base64", bytes=len(img_data)):
+            img_b64 = base64.b64encode(img_data).decode("utf-8")
+        return await self.anki_request('storeMediaFile', filename=compressed_filename, data=img_b64)
+
+    async def _multi(self, actions):
+        """通过multi动作一次请求执行多个AnkiConnect动作，返回每个动作的响应列表（失败返回None）"""
+        response = await self.anki_request('multi', actions=[
+            {'action': action, 'version': 6, 'params': params} for action, params in actions
+        ])
+        if not response or response.get('error') or response.get('result') is None:
+            print(f"批量请求失败: {response.get('error') if response else '无响应'}")
+            return None
+        return response['result']
+
+    def _build_fields(self, result, compressed_filename, audio_filename, mode):
+        """根据解析结果、图片文件名、发音文件名（可为None）和语言模式构造笔记字段"""
+        return {
+            self.fields["word"]: result['word'],
+            self.fields["pronunciation"]: result['pronunciation'],
+            self.fields["meaning"]: result['meaning'],
+            self.fields["note"]: result['note'],
+            self.fields["example"]: f'{result["example"]}<br><img src="{compressed_filename}">',
+            self.fields["voice"]: f'[sound:{audio_filename}]' if audio_filename
+            else self.make_voice_url(result['word'], result['pronunciation'], mode)
+        }
 
-            note = {
-                "deckName": self.cards_name,
+    async def _find_notes(self, deck, all_fields):
+        """返回每组字段对应的已存在笔记ID（不存在为None），查询失败返回None
+
+        优先使用本地单词索引；索引不可用时用一次multi请求逐个findNotes查询。
+        """
+        word_field = self.fields["word"]  # 获取配置中的word字段名（如"单词"）
+        if self.note_index and await self.note_index.ensure(deck):
+            return [self.note_index.lookup(deck, fields[word_field]) for fields in all_fields]
+
+        # 格式：deck:"牌组" 字段名:字段值（与单词索引一样只在该牌组中查找）
+        deck_query = NoteIndex._deck_query(deck)
+        search_responses = await self._multi([
+            ('findNotes', {'query': f'{deck_query} {word_field}:{fields[word_field]}'}) for fields in all_fields
+        ])
+        if search_responses is None:
+            return None
+        note_ids = []
+        for fields, search_response in zip(all_fields, search_responses):
+            print(f"查询[{fields[word_field]}]卡片响应: {search_response}")  # 打印查询结果
+            found = search_response.get('result') if search_response else None
+            note_ids.append(found[0] if found else None)  # 取第一张卡片ID
+        return note_ids
+
+    def _append_example(self, fields, result, compressed_filename, audio_filename=None):
+        """把一条例句追加到已有的例句、笔记、释义字段（添加<br>分隔），发音字段保持不变"""
+        fields[self.fields["example"]] = f"""{fields[self.fields["example"]]}<br>2.{result["example"]}<br><img src="{compressed_filename}">"""
+        fields[self.fields["note"]] = f"""{fields[self.fields["note"]]}<br>例句2含义：{result["note"]}"""
+        fields[self.fields["meaning"]] = f"""{fields[self.fields["meaning"]]}<br>{result["meaning"]}"""
+
+    async def write_notes(self, items, mode):
+        """批量写入笔记：已存在相同单词的笔记则追加例句，否则新建
+
+        items为 (解析结果, 图片文件名, 发音文件名或None) 列表，全部写入mode对应的牌组，返回与之等长的状态列表，
+        状态取值为 created / updated / create_failed / update_failed。
+        同一单词（忽略大小写和首尾空白）的多个条目先合并为一次新建或更新，
+        查询、获取详情、新建、更新各只需一次HTTP请求。
+        """
+        # 多个任务同时写入时串行执行，避免同一单词在查询和新建之间被另一任务抢先新建
+        if self.write_lock is None:
+            self.write_lock = asyncio.Lock()
+        async with self.write_lock:
+            return await self._write_notes(items, mode)
+
+    async def _write_notes(self, items, mode):
+        statuses = [None] * len(items)
+        deck = self.deck_for(mode)
+
+        # 按规范化后的单词分组，每组只查询和写入一次
+        groups = {}
+        for idx, (result, _, _) in enumerate(items):
+            groups.setdefault(normalize_word(result['word']), []).append(idx)
+        groups = list(groups.values())
+        first_fields = [self._build_fields(*items[indices[0]], mode) for indices in groups]
+
+        note_ids = await self._find_notes(deck, first_fields)
+        if note_ids is None:
+            return ['create_failed'] * len(items)
+
+        # 一次notesInfo请求获取所有已存在笔记的详情
+        existing_ids = list(dict.fromkeys(nid for nid in note_ids if nid is not None))
+        current_notes = {}
+        mismatched = set()  # 缺少例句、笔记或释义字段的笔记（如同一牌组中其他笔记类型的笔记）
+        if existing_ids:
+            get_note_response = await self.anki_request('notesInfo', notes=existing_ids)
+            if get_note_response and not get_note_response.get('error') and get_note_response.get('result'):
+                for note in get_note_response['result']:
+                    if note and 'noteId' in note:
+                        names = (self.fields["example"], self.fields["note"], self.fields["meaning"])
+                        note_fields = note.get('fields') or {}
+                        if not all(name in note_fields for name in names):
+                            print(f"卡片{note['noteId']}缺少例句、笔记或释义字段（可能是其他笔记类型），无法追加例句")
+                            mismatched.add(note['noteId'])
+                            continue
+                        current_notes[note['noteId']] = {name: note_fields[name]['value'] for name in names}
+            else:
+                print(f"获取卡片详情失败: {get_note_response.get('error') if get_note_response else '无响应'}")
+                existing_ids = []  # 无法判断笔记是否存在，按更新失败处理
+
+        # 索引中有但Anki中已删除的笔记：移出索引并改为新建
+        for nid in existing_ids:
+            if nid not in current_notes and nid not in mismatched:
+                if self.note_index:
+                    self.note_index.forget(deck, nid)
+                note_ids = [None if x == nid else x for x in note_ids]
+
+        # 每组的全部例句在内存中依次叠加：已存在的笔记追加到现有字段，新笔记以第一条为基础追加其余条目
+        updates = {}
+        new_groups = []
+        for g, (indices, note_id) in enumerate(zip(groups, note_ids)):
+            if note_id is None:
+                for idx in indices[1:]:
+                    self._append_example(first_fields[g], *items[idx])
+                new_groups.append(g)
+                continue
+            current = current_notes.get(note_id)
+            if current is None:
+                for idx in indices:
+                    statuses[idx] = 'update_failed'
+                continue
+            for idx in indices:
+                self._append_example(current, *items[idx])
+            updates[note_id] = (current, indices)
+
+        # 一次addNotes请求新建所有不存在的笔记
+        if new_groups:
+            response = await self.anki_request('addNotes', notes=[{
+                "deckName": deck,
                 "modelName": self.model_name,
-                "fields": fields,
+                "fields": first_fields[g],
                 "options": {"allowDuplicate": True}
-            }
-
-            # 新增：查询是否存在相同word字段的卡片
-            word_field = self.fields["word"]  # 获取配置中的word字段名（如"单词"）
-            word_value = fields[word_field]   # 当前要添加的单词值
-            # 构造Anki搜索查询（格式："字段名:字段值"）
-            search_query = f'{word_field}:{word_value}'
-            # 调用findNotes接口查询笔记ID
-            search_response = self.anki_request('findNotes', query=search_query)
-            print(f"查询[{word_value}]卡片响应: {search_response}")  # 打印查询结果
-
-            # 新增：获取第一张卡片ID并更新例句字段
-            if search_response and 'result' in search_response and search_response['result']:
-                note_id = search_response['result'][0]  # 获取第一张卡片ID
-                # 获取卡片详情
-                get_note_response = self.anki_request('notesInfo', notes=[note_id])
-                if get_note_response and not get_note_response.get('error') and 'result' in get_note_response:
-                    current_note = get_note_response['result'][0]
-                    # 提取原例句内容
-                    current_example = current_note['fields'][self.fields["example"]]['value']
-                    current_notes = current_note['fields'][self.fields["note"]]['value']
-                    current_meaning = current_note['fields'][self.fields["meaning"]]['value']
-                    # 拼接新例句（添加<br>分隔）
-                    new_example = f"""{current_example}<br>2.{result["example"]}<br><img src="{compressed_filename}">"""
-                    new_note = f"""{current_notes}<br>例句2含义：{result["note"]}"""
-                    new_meaning = f"""{current_meaning}<br>{result["meaning"]}"""
-                    # 更新例句字段
-                    update_response = self.anki_request('updateNoteFields', note={
-                        "id": note_id,
-                        "fields": {self.fields["example"]: new_example,
-                                   self.fields["note"]: new_note,
-                                   self.fields["meaning"]: new_meaning}
-                    })
-
-                    if update_response and not update_response.get('error'):
-                        print(f"成功更新卡片{note_id}的字段")
-                        btn.config(bg='green', text='已更新')
-                    else:
-                        print(f"更新失败: {update_response.get('error') if update_response else '无响应'}")
-                        btn.config(state="normal", text="更新失败")
+            } for g in new_groups])
+            created_ids = response.get('result') if response else None
+            print(f"创建卡片结果：{created_ids}")
+            for k, g in enumerate(new_groups):
+                ok = created_ids and k < len(created_ids) and created_ids[k]
+                for idx in groups[g]:
+                    statuses[idx] = 'created' if ok else 'create_failed'
+                if ok and self.note_index:
+                    self.note_index.add(deck, first_fields[g][self.fields["word"]], created_ids[k])
+
+        # 一次multi请求更新所有已存在的笔记
+        if updates:
+            update_ids = list(updates)
+            update_responses = await self._multi([
+                ('updateNoteFields', {'note': {"id": note_id, "fields": updates[note_id][0]}}) for note_id in update_ids
+            ])
+            for k, note_id in enumerate(update_ids):
+                update_response = update_responses[k] if update_responses else None
+                if update_response and not update_response.get('error'):
+                    print(f"成功更新卡片{note_id}的字段")
+                    status = 'updated'
                 else:
-                    print(f"获取卡片详情失败: {get_note_response.get('error') if get_note_response else '无响应'}")
-                    btn.config(state="normal", text="更新失败")
-            else:
-                response = self.anki_request('addNote', note=note)
-                print(f"成功创建卡片：{response['result']}")
-                if response and not response.get('error'):
-                    btn.config(bg='green', text='已创建')
-                else:
-                    btn.config(state="normal", text="创建失败")
-
-        threading.Thread(target=async_task, daemon=True).start()
-
-    def create_anki_cards(self, filenames, user_inputs, buttons):
-        """异步批量创建Anki卡片"""
-        def async_task():
-            if len(filenames) != len(user_inputs) or len(filenames) != len(buttons):
-                for btn in buttons:
-                    btn.config(state="normal")
-                return
-
-            raw_names = [os.path.splitext(f)[0] for f in filenames]
-            results = self.openai_client.explain_batch(raw_names, user_inputs) if self.openai_client else []
-
-            success_count = 0
-            for i, (filename, user_input, btn, result) in enumerate(zip(filenames, user_inputs, buttons, results)):
-                if result.get('error'):
-                    btn.config(text='创建失败')
-                    continue
-
-                media_result = self.store_media_file(filename)
-                if not media_result or media_result.get('response', {}).get('error'):
-                    btn.config(text='创建失败')
-                    continue
-
-                compressed_filename = media_result['filename']
-                fields = {
-                    self.fields["word"]: result['word'],
-                    self.fields["pronunciation"]: result['pronunciation'],
-                    self.fields["meaning"]: result['meaning'],
-                    self.fields["note"]: result['note'],
-                    self.fields["example"]: f'{result["example"]}<br><img src="{compressed_filename}">',
-                    self.fields["voice"]: self.make_voice_url(result['word'], result['pronunciation'])
-                }
-
-                note_data = {
-                    "deckName": self.cards_name,
-                    "modelName": self.model_name,
-                    "fields": fields,
-                    "options": {"allowDuplicate": True}
-                }
-
-                # 新增：查询是否存在相同word字段的卡片
-                word_field = self.fields["word"]  # 获取配置中的word字段名（如"单词"）
-                word_value = fields[word_field]  # 当前要添加的单词值
-                # 构造Anki搜索查询（格式："字段名:字段值"）
-                search_query = f'{word_field}:{word_value}'
-                # 调用findNotes接口查询笔记ID
-                search_response = self.anki_request('findNotes', query=search_query)
-                print(f"查询[{word_value}]卡片响应: {search_response}")  # 打印查询结果
-
-                # 新增：获取第一张卡片ID并更新例句字段
-                if search_response and 'result' in search_response and search_response['result']:
-                    note_id = search_response['result'][0]  # 获取第一张卡片ID
-                    # 获取卡片详情
-                    get_note_response = self.anki_request('notesInfo', notes=[note_id])
-                    if get_note_response and not get_note_response.get('error') and 'result' in get_note_response:
-                        current_note = get_note_response['result'][0]
-                        # 提取原例句内容
-                        current_example = current_note['fields'][self.fields["example"]]['value']
-                        current_notes = current_note['fields'][self.fields["note"]]['value']
-                        current_meaning = current_note['fields'][self.fields["meaning"]]['value']
-                        # 拼接新例句（添加<br>分隔）
-                        new_example = f"""{current_example}<br>2.{result["example"]}<br><img src="{compressed_filename}">"""
-                        new_note = f"""{current_notes}<br>例句2含义：{result["note"]}"""
-                        new_meaning = f"""{current_meaning}<br>{result["meaning"]}"""
-                        # 更新例句字段
-                        update_response = self.anki_request('updateNoteFields', note={
-                            "id": note_id,
-                            "fields": {self.fields["example"]: new_example,
-                                       self.fields["note"]: new_note,
-                                       self.fields["meaning"]: new_meaning}
-                        })
-
-                        if update_response and not update_response.get('error'):
-                            success_count += 1
-                            print(f"成功更新卡片{note_id}的字段")
-                            btn.config(bg='green', text='已更新')
-                        else:
-                            print(f"更新失败: {update_response.get('error') if update_response else '无响应'}")
-                            btn.config(state="normal", text="更新失败")
-                    else:
-                        print(f"获取卡片详情失败: {get_note_response.get('error') if get_note_response else '无响应'}")
-                        btn.config(state="normal", text="更新失败")
-                else:
-                    response = self.anki_request('addNote', note=note_data)
-                    print(f"成功创建卡片：{response['result']}")
-                    if response and not response.get('error'):
-                        success_count += 1
-                        btn.config(bg='green', text='已创建')
-                    else:
-                        btn.config(state="normal", text="创建失败")
-
-            if success_count > 0:
-                # 需通过main.py的root更新UI提示
-                # 实际使用时需通过ImageViewerApp的root传递
-                pass
-
-        threading.Thread(target=async_task, daemon=True).start()
\ No newline at end of file
+                    print(f"更新失败: {update_response.get('error') if update_response else '无响应'}")
+                    status = 'update_failed'
+                for idx in updates[note_id][1]:
+                    statuses[idx] = status
+
+        return statuses
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+
+from media_manifest import UploadedMedia
+
+
+class AudioCache(UploadedMedia):
+    """单词发音的本地缓存：音频文件保存在audio_dir，键 -> 文件名的对应关系和上传记录保存在SQLite中
+
+    键由发音来源决定（见HttpAudioFetcher.cache_key），同一单词只下载一次；文件名带内容哈希，
+    内容相同的发音只上传一次到Anki媒体库。确认没有发音的单词也会记录，missing_retry_hours小时内不再下载。
+    """
+    table = "uploaded"
+    pattern = "*.mp3"
+    label = "发音文件"
+
+    def __init__(self, db_path, audio_dir, missing_retry_hours=24):
+        self.audio_dir = audio_dir
+        self.missing_retry_hours = missing_retry_hours
+        os.makedirs(audio_dir, exist_ok=True)
+        super().__init__(db_path, (
+            """CREATE TABLE IF NOT EXISTS audio (
+                key TEXT PRIMARY KEY,
+                filename TEXT,
+                fetched REAL NOT NULL
+            )""",
+            """CREATE TABLE IF NOT EXISTS uploaded (
+                filename TEXT PRIMARY KEY,
+                uploaded REAL NOT NULL
+            )"""
+        ))
+
+    @classmethod
+    def from_config(cls, config):
+        """根据config.ini的[audio]部分创建缓存，未启用时返回None"""
+        if not config.getboolean("audio", "enabled", fallback=True):
+            return None
+        base_dir = os.path.dirname(__file__)
+        path = config.get("audio", "path", fallback="cache/audio.sqlite3")
+        audio_dir = config.get("audio", "dir", fallback="cache/audio")
+        return cls(
+            path if os.path.isabs(path) else os.path.join(base_dir, path),
+            audio_dir if os.path.isabs(audio_dir) else os.path.join(base_dir, audio_dir),
+            missing_retry_hours=config.getfloat("audio", "missing_retry_hours", fallback=24)
+        )
+
+    def lookup(self, key):
+        """返回 (文件名, 本地路径)；已确认没有发音时返回 (None, None)，未下载过或本地文件已删除时返回None"""
+        with self.lock:
+            row = self.conn.execute("SELECT filename, fetched FROM audio WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        filename, fetched = row
+        if filename is None:
+            if time.time() - fetched < self.missing_retry_hours * 3600:
+                return None, None
+            return None
+        path = os.path.join(self.audio_dir, filename)
+        return (filename, path) if os.path.exists(path) else None
+
+    def put(self, key, filename, data):
+        """保存下载的音频（先写临时文件再改名），返回本地路径"""
+        path = os.path.join(self.audio_dir, filename)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO audio (key, filename, fetched) VALUES (?, ?, ?)", (key, filename, time.time())
+            )
+            self.conn.commit()
+        return path
+
+    def put_missing(self, key):
+        """记录该单词没有可用的发音"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO audio (key, filename, fetched) VALUES (?, NULL, ?)", (key, time.time())
+            )
+            self.conn.commit()
+
+    def mark_uploaded(self, filename):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO uploaded (filename, uploaded) VALUES (?, ?)", (filename, time.time())
+            )
+            self.conn.commit()
@@ -0,0 +1,78 @@
+import hashlib
+from urllib.parse import quote
+
+import httpx
+
+# 默认的发音来源：日语使用LanguagePod101（需要假名），英语使用有道词典
+DEFAULT_AUDIO_URLS = {
+    "jp": "https://assets.languagepod101.com/dictionary/japanese/audiomp3.php?kanji={word}&kana={pronunciation}",
+    "en": "https://dict.youdao.com/dictvoice?audio={word}"
+}
+# 发音来源对没有录音的单词返回的固定音频（SHA-256）：LanguagePod101的
+# "The audio for this clip is currently not available..."（HTTP 200，audio/mpeg）
+PLACEHOLDER_SHA256 = (
+    "ae6398b5a27bc8c0a771df6c907ade794be15518174773c58c7c7ddd17098906",
+)
+
+
+class HttpAudioFetcher:
+    """按URL模板下载单词发音，模板中的{word}和{pronunciation}替换为单词和读音
+
+    AnkiConnect只通过cache_key()和fetch()使用发音来源，可替换为任何提供这两个方法的对象
+    （如本地的模拟服务，见benchmarks/fake_audio.py）。
+    httpx.AsyncClient在首次请求时创建，之后只能在同一个事件循环中使用（见pipeline.EventLoopThread）。
+    """
+
+    def __init__(self, url_templates, timeout=10.0, placeholder_sha256=PLACEHOLDER_SHA256):
+        self.url_templates = dict(url_templates)
+        self.timeout = timeout
+        self.placeholder_sha256 = {h.strip().lower() for h in placeholder_sha256 if h.strip()}
+        self.client = None
+
+    @classmethod
+    def from_config(cls, config):
+        """根据config.ini的[audio]部分创建"""
+        return cls(
+            {mode: config.get("audio", f"{mode}_url", fallback=url) for mode, url in DEFAULT_AUDIO_URLS.items()},
+            timeout=config.getfloat("audio", "timeout", fallback=10.0),
+            placeholder_sha256=config.get(
+                "audio", "placeholder_sha256", fallback=",".join(PLACEHOLDER_SHA256)
+            ).split(",")
+        )
+
+    def url(self, word, pronunciation, mode, escape=True):
+        """返回该单词的发音地址，没有对应模板时返回None"""
+        template = self.url_templates.get(mode)
+        if not template:
+            return None
+        if escape:
+            word, pronunciation = quote(word), quote(pronunciation or "")
+        return template.format(word=word, pronunciation=pronunciation)
+
+    def cache_key(self, word, pronunciation, mode):
+        """本地缓存的键：同一发音地址只下载一次，修改模板后自动重新下载"""
+        return self.url(word, pronunciation, mode)
+
+    async def fetch(self, word, pronunciation, mode):
+        """下载发音，返回音频字节；确认没有发音（404、空响应、返回网页或"暂无录音"的占位音频）时返回None，
+        网络错误时抛出异常"""
+        url = self.url(word, pronunciation, mode)
+        if url is None:
+            return None
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True)
+        response = await self.client.get(url)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "")
+        if not response.content or content_type.startswith(("text/", "application/json")):
+            return None
+        if hashlib.sha256(response.content).hexdigest() in self.placeholder_sha256:
+            return None
+        return response.content
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
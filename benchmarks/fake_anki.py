@@ -0,0 +1,127 @@
+"""本地模拟的AnkiConnect服务，用于在没有Anki的情况下测量处理速度
+
+支持 storeMediaFile / getMediaFilesNames / findNotes / notesInfo / addNote / addNotes / updateNoteFields / multi，
+每个请求可附加固定延迟以模拟真实Anki的响应时间。
+"""
+import fnmatch
+import json
+import shlex
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeAnkiState:
+    def __init__(self, latency=0.0):
+        self.latency = latency  # 每个HTTP请求的额外延迟（秒）
+        self.notes = {}  # 笔记ID -> 字段
+        self.decks = {}  # 笔记ID -> 牌组名
+        self.modified = {}  # 笔记ID -> 最后修改时间
+        self.media = {}  # 文件名 -> 大小
+        self.next_id = 1
+        self.requests = {}  # 动作名 -> 请求次数
+        self.lock = threading.Lock()
+
+    def handle(self, action, params):
+        """执行单个动作，返回 (result, error)"""
+        with self.lock:
+            self.requests[action] = self.requests.get(action, 0) + 1
+            if action == "multi":
+                return [
+                    {"result": result, "error": error}
+                    for result, error in (self._handle(a["action"], a.get("params", {})) for a in params["actions"])
+                ], None
+            return self._handle(action, params)
+
+    def _handle(self, action, params):
+        if action == "storeMediaFile":
+            if params.get("path"):
+                # 与AnkiConnect一致：在请求内读取文件（模拟服务与调用方在同一台电脑上）
+                try:
+                    with open(params["path"], "rb") as f:
+                        self.media[params["filename"]] = len(f.read())
+                except OSError as e:
+                    return None, str(e)
+            else:
+                self.media[params["filename"]] = len(params.get("data") or "")
+            return params["filename"], None
+        if action == "getMediaFilesNames":
+            return fnmatch.filter(list(self.media), params.get("pattern", "*")), None
+        if action == "findNotes":
+            return [nid for nid in self.notes if self._match(nid, params["query"])], None
+        if action == "notesInfo":
+            return [
+                {"noteId": nid, "mod": int(self.modified[nid]),
+                 "fields": {name: {"value": value, "order": i}
+                            for i, (name, value) in enumerate(self.notes[nid].items())}}
+                if nid in self.notes else {}
+                for nid in params["notes"]
+            ], None
+        if action == "addNote":
+            return self._add(params["note"]), None
+        if action == "addNotes":
+            return [self._add(note) for note in params["notes"]], None
+        if action == "updateNoteFields":
+            note = params["note"]
+            if note["id"] not in self.notes:
+                return None, "note was not found"
+            self.notes[note["id"]].update(note["fields"])
+            self.modified[note["id"]] = time.time()
+            return None, None
+        if action == "version":
+            return 6, None
+        return None, f"unsupported action: {action}"
+
+    def _add(self, note):
+        nid = self.next_id
+        self.next_id += 1
+        self.notes[nid] = dict(note["fields"])
+        self.decks[nid] = note.get("deckName", "")
+        self.modified[nid] = time.time()
+        return nid
+
+    def _match(self, nid, query):
+        """支持以空格连接的 deck:"牌组"、edited:天数 和 字段名:值 条件"""
+        for term in shlex.split(query):
+            key, _, value = term.partition(":")
+            if key == "deck":
+                if self.decks.get(nid) != value:
+                    return False
+            elif key == "edited":
+                if time.time() - self.modified[nid] > int(value) * 86400:
+                    return False
+            elif (self.notes[nid].get(key) or "").casefold() != value.casefold():
+                return False
+        return True
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 支持keep-alive
+        disable_nagle_algorithm = True  # 响应头和正文分两次写出，关闭Nagle避免40ms的延迟确认
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if state.latency:
+                time.sleep(state.latency)
+            result, error = state.handle(body["action"], body.get("params", {}))
+            data = json.dumps({"result": result, "error": error}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(latency=0.0, port=0):
+    """在后台线程启动服务，返回 (server, state, url)；port为0时自动分配端口"""
+    state = FakeAnkiState(latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
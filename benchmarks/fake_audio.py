@@ -0,0 +1,74 @@
+"""本地模拟的发音服务，用于在没有网络的情况下测试和测量发音下载
+
+GET /{mode}?word=单词&pronunciation=读音 返回按单词生成的固定音频数据（同一单词内容相同），
+missing_every为n时每n个不同单词中有一个没有发音：默认返回404；placeholder为True时与LanguagePod101一样
+返回HTTP 200和固定的"暂无录音"音频PLACEHOLDER_AUDIO。
+"""
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PLACEHOLDER_AUDIO = b"ID3" + b"\x00" * 4093
+
+
+class FakeAudioState:
+    def __init__(self, latency=0.0, missing_every=0, size=8192, placeholder=False):
+        self.latency = latency  # 每个请求的额外延迟（秒）
+        self.missing_every = missing_every
+        self.size = size  # 每个音频的字节数
+        self.placeholder = placeholder
+        self.requests = {}  # 单词 -> 请求次数
+        self.lock = threading.Lock()
+
+    def audio(self, word):
+        """返回该单词的音频数据，没有发音时返回None"""
+        with self.lock:
+            self.requests[word] = self.requests.get(word, 0) + 1
+        digest = hashlib.sha1(word.encode("utf-8")).digest()
+        if self.missing_every and int.from_bytes(digest[:4], "big") % self.missing_every == 0:
+            return PLACEHOLDER_AUDIO if self.placeholder else None
+        return b"ID3" + (digest * (self.size // len(digest) + 1))[:self.size - 3]
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 支持keep-alive
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            if state.latency:
+                time.sleep(state.latency)
+            data = state.audio(query.get("word", [""])[0])
+            if data is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(latency=0.0, port=0, missing_every=0, placeholder=False):
+    """在后台线程启动服务，返回 (server, state, url_templates)；port为0时自动分配端口
+
+    url_templates可直接传给audio_fetcher.HttpAudioFetcher。
+    """
+    state = FakeAudioState(latency, missing_every, placeholder=placeholder)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    return server, state, {
+        mode: f"{base}/{mode}?word={{word}}&pronunciation={{pronunciation}}" for mode in ("jp", "en")
+    }
@@ -0,0 +1,188 @@
+"""本地模拟的OpenAI兼容 /v1/chat/completions 服务
+
+从项目的提示词中解析出例句和单词，返回与提示词示例格式一致的JSON（支持stream=True的SSE响应）。
+delay为每个请求的首字延迟，item_delay为生成每个单词结果所需的时间。
+max_concurrent大于0时模拟服务商的并发额度：超出的请求返回429及Retry-After响应头。
+corrupt_every大于0时每隔该数量的单词结果生成一个格式错误的对象（轮流为缺少逗号和无法修复两种）。
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAIR_PATTERN = re.compile(r"例句：(.*?)\n\s*单词：(.*?)\n")
+
+
+class FakeOpenAIState:
+    def __init__(self, delay=0.0, item_delay=0.0, max_concurrent=0, retry_after_ms=200, corrupt_every=0):
+        self.delay = delay
+        self.item_delay = item_delay
+        self.corrupt_every = corrupt_every
+        self.items = 0
+        self.max_concurrent = max_concurrent
+        self.retry_after_ms = retry_after_ms
+        self.requests = 0
+        self.throttled = 0
+        self.active = 0
+        self.lock = threading.Lock()
+
+
+def extract_pairs(prompt):
+    """返回提示词中需要解析的 (例句, 单词) 列表（跳过提示词中的示例部分）"""
+    if "需要分析的例句-单词对：" in prompt:
+        return PAIR_PATTERN.findall(prompt.split("需要分析的例句-单词对：", 1)[1] + "\n")
+    if "当前输入：" in prompt:
+        return PAIR_PATTERN.findall(prompt.split("当前输入：", 1)[1] + "\n")[:1]
+    return []
+
+
+def make_item(subtitle, key):
+    return {
+        "单词": key,
+        "音标": f"/{key}/",
+        "意义": f"{key} 的释义",
+        "例句": subtitle.replace(key, f"<b>{key}</b>", 1),
+        "笔记": f"「{key}」在这里的含义"
+    }
+
+
+def render_item(state, item):
+    """把单词结果转换为JSON文本，按corrupt_every制造格式错误"""
+    text = json.dumps(item, ensure_ascii=False, indent=2)
+    with state.lock:
+        state.items += 1
+        count = state.items
+    if state.corrupt_every and count % state.corrupt_every == 0:
+        if count // state.corrupt_every % 2:
+            text = text.replace(",\n", "\n", 1)  # 缺少逗号，可以修复
+        else:
+            text = text.replace('"意义": ', '"意义": undefined, "原文": ', 1)  # 无法修复
+    return text
+
+
+def render(state, items, batch, wrap):
+    """返回响应内容的分段列表：批量时为数组（JSON模式下包在"结果"对象中），否则为单个对象"""
+    if not batch:
+        return [render_item(state, items[0]) if items else "{}"]
+    pieces = ['{"结果": [\n' if wrap else "[\n"]
+    for i, item in enumerate(items):
+        text = render_item(state, item)
+        if i < len(items) - 1:
+            text += ",\n"
+        pieces.append(text)
+    pieces.append("\n]}" if wrap else "\n]")
+    return pieces
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with state.lock:
+                state.requests += 1
+                throttled = bool(state.max_concurrent) and state.active >= state.max_concurrent
+                if throttled:
+                    state.throttled += 1
+                else:
+                    state.active += 1
+            if throttled:
+                self._send_json({"error": {"message": "Rate limit reached", "type": "requests",
+                                           "code": "rate_limit_exceeded"}},
+                                status=429, headers={"retry-after-ms": str(state.retry_after_ms)})
+                return
+            try:
+                self._handle(body)
+            finally:
+                with state.lock:
+                    state.active -= 1
+
+        def _handle(self, body):
+            prompt = body["messages"][-1]["content"]
+            pairs = extract_pairs(prompt)
+            batch = "需要分析的例句-单词对：" in prompt
+            items = [make_item(subtitle.strip(), key.strip()) for subtitle, key in pairs]
+            if batch:
+                for i, item in enumerate(items):
+                    item["序号"] = i + 1
+            wrap = (body.get("response_format") or {}).get("type") == "json_object"
+            usage = {"prompt_tokens": len(prompt), "completion_tokens": 60 * len(items),
+                     "total_tokens": len(prompt) + 60 * len(items)}
+
+            if state.delay:
+                time.sleep(state.delay)
+            if body.get("stream"):
+                self._stream(body, render(state, items, batch, wrap), usage)
+                return
+
+            time.sleep(state.item_delay * len(items))
+            content = "".join(render(state, items, batch, wrap))
+            self._send_json({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        def _stream(self, body, pieces, usage):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for piece in pieces:
+                if piece.startswith("{"):
+                    time.sleep(state.item_delay)
+                self._send_event({
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                })
+            if (body.get("stream_options") or {}).get("include_usage"):
+                # 与OpenAI一致：token用量放在最后一个choices为空的分块中
+                self._send_event({
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [],
+                    "usage": usage
+                })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+        def _send_event(self, payload):
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def _send_json(self, payload, status=200, headers=None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(delay=0.0, item_delay=0.0, port=0, max_concurrent=0, corrupt_every=0):
+    """在后台线程启动服务，返回 (server, state, base_url)"""
+    state = FakeOpenAIState(delay, item_delay, max_concurrent, corrupt_every=corrupt_every)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}/v1"
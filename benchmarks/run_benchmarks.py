@@ -0,0 +1,207 @@
+"""性能基准：使用本地模拟的AnkiConnect、OpenAI和发音服务测量处理速度
+
+用法（在项目根目录执行）：
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 10 100 --scenarios create_anki_cards --llm-delay 0.5
+
+每个场景和数量在独立子进程中运行，以便分别统计峰值内存。输出每秒处理张数、
+单张耗时的p50/p99和峰值RSS。load_folder场景测量打开文件夹时的扫描和缩略图解码
+（首次打开与再次打开），不创建Tk窗口。
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = ("create_anki_card", "create_anki_cards", "load_folder")
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），无法获取时返回None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+def build_pipeline(folder, args):
+    from anki_connect import AnkiConnect
+    from audio_cache import AudioCache
+    from audio_fetcher import HttpAudioFetcher
+    from media_manifest import MediaManifest
+    from openai_utils import OpenAIExplanation
+    from pipeline import CardPipeline
+    from benchmarks import fake_anki, fake_audio, fake_openai
+
+    _, anki_state, anki_url = fake_anki.start_server(latency=args.anki_latency)
+    _, _, openai_url = fake_openai.start_server(delay=args.llm_delay, item_delay=args.llm_item_delay,
+                                                max_concurrent=args.llm_max_concurrent,
+                                                corrupt_every=args.llm_corrupt_every)
+    _, _, audio_urls = fake_audio.start_server(latency=args.audio_latency)
+
+    anki_connect = AnkiConnect()
+    anki_connect.client.url = anki_url
+    anki_connect.folder_path = folder
+    # 使用临时的媒体清单，避免与真实Anki媒体库的清单互相影响
+    anki_connect.media_manifest = MediaManifest(os.path.join(tempfile.mkdtemp(), "media_manifest.sqlite3"))
+    # 发音从模拟服务下载，保存在临时缓存中
+    anki_connect.audio_fetcher = HttpAudioFetcher(audio_urls)
+    audio_dir = tempfile.mkdtemp()
+    anki_connect.audio_cache = AudioCache(os.path.join(audio_dir, "audio.sqlite3"), audio_dir)
+    anki_connect.compressor.staging_dir = tempfile.mkdtemp() if args.precompress else None
+    if args.precompress:
+        # 模拟打开文件夹后的后台预压缩，等待全部完成后再开始计时
+        from concurrent.futures import wait
+        anki_connect.compressor.precompress([os.path.join(folder, f) for f in os.listdir(folder)])
+        wait(list(anki_connect.compressor.background.values()))
+    explainer = OpenAIExplanation(
+        api_key="fake", base_url=openai_url, model_name="fake",
+        batch_size=args.batch_size, max_workers=args.max_workers, stream=not args.no_stream,
+        max_concurrency=args.max_concurrency
+    )
+    pipeline = CardPipeline(anki_connect, explainer)
+    return pipeline, anki_state
+
+
+def bench_create_anki_card(jobs, folder, args):
+    """逐张创建（与界面中点击单行"创建卡片"相同的流程）"""
+    pipeline, _ = build_pipeline(folder, args)
+    latencies = []
+    start = time.perf_counter()
+    for filename, word in jobs:
+        t0 = time.perf_counter()
+        pipeline.run([filename], [word])
+        latencies.append(time.perf_counter() - t0)
+    return time.perf_counter() - start, latencies
+
+
+def bench_create_anki_cards(jobs, folder, args):
+    """一次批量创建，单张耗时为从批量开始到该卡片写入完成的时间"""
+    pipeline, _ = build_pipeline(folder, args)
+    done_at = {}
+    start = time.perf_counter()
+    pipeline.run([f for f, _ in jobs], [w for _, w in jobs],
+                 on_progress=lambda index, status: done_at.setdefault(index, time.perf_counter() - start))
+    return time.perf_counter() - start, list(done_at.values())
+
+
+def bench_load_folder(jobs, folder, args):
+    """扫描文件夹并解码全部缩略图：先在空缓存上测一次，再测缓存命中的情况"""
+    from thumbnail_cache import ThumbnailCache
+
+    valid_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ThumbnailCache(cache_dir)
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(2):
+            files = [
+                f for f in os.listdir(folder)
+                if os.path.splitext(f)[1].lower() in valid_extensions
+            ]
+            files.sort(key=lambda f: os.path.getctime(os.path.join(folder, f)))
+            for filename in files:
+                t0 = time.perf_counter()
+                cache.load(os.path.join(folder, filename))
+                latencies.append(time.perf_counter() - t0)
+        return time.perf_counter() - start, latencies
+
+
+def run_child(scenario, size, args):
+    from benchmarks.synthetic import generate_folder
+
+    folder = os.path.join(DATA_DIR, f"{args.mode}_{size}")
+    jobs = generate_folder(folder, size, mode=args.mode)
+    bench = globals()[f"bench_{scenario}"]
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        elapsed, latencies = bench(jobs, folder, args)
+    return {
+        "scenario": scenario,
+        "size": size,
+        "elapsed": elapsed,
+        "items_per_sec": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PicSubToAnki性能基准")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--mode", choices=("jp", "en", "mixed"), default="jp", help="mixed为日语和英语截图交替")
+    parser.add_argument("--anki-latency", type=float, default=0.002, help="模拟Anki每个请求的延迟（秒）")
+    parser.add_argument("--llm-delay", type=float, default=0.3, help="模拟模型每个请求的首字延迟（秒）")
+    parser.add_argument("--llm-item-delay", type=float, default=0.02, help="模拟模型生成每个单词结果的时间（秒）")
+    parser.add_argument("--audio-latency", type=float, default=0.05, help="模拟发音服务每个请求的延迟（秒）")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--max-concurrency", type=int, help="大模型请求自适应并发的上限（默认与--max-workers相同）")
+    parser.add_argument("--llm-max-concurrent", type=int, default=0,
+                        help="模拟服务商的并发额度，超出时返回429（默认不限制）")
+    parser.add_argument("--llm-corrupt-every", type=int, default=0,
+                        help="模拟模型每隔该数量的单词结果输出一个格式错误的JSON对象（默认不出错）")
+    parser.add_argument("--no-stream", action="store_true", help="批量查询不使用流式响应")
+    parser.add_argument("--precompress", action="store_true", help="计时前先在后台预压缩全部截图（模拟打开文件夹后的预压缩）")
+    parser.add_argument("--output", help="把结果以JSON格式写入该文件")
+    parser.add_argument("--child", nargs=3, metavar=("SCENARIO", "SIZE", "RESULT_FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        scenario, size, result_file = args.child
+        result = run_child(scenario, int(size), args)
+        with open(result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    forwarded = list(argv if argv is not None else sys.argv[1:])
+    results = []
+    print(f"{'场景':<20}{'数量':>6}{'张/秒':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'峰值RSS(MB)':>14}")
+    for scenario in args.scenarios:
+        for size in args.sizes:
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+                result_file = tmp.name
+            try:
+                subprocess.run(
+                    [sys.executable, "-m", "benchmarks.run_benchmarks", *forwarded,
+                     "--child", scenario, str(size), result_file],
+                    check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                )
+                with open(result_file, encoding="utf-8") as f:
+                    result = json.load(f)
+            finally:
+                os.remove(result_file)
+            results.append(result)
+            rss = f"{result['peak_rss_mb']:.1f}" if result["peak_rss_mb"] is not None else "n/a"
+            print(f"{scenario:<20}{size:>6}{result['items_per_sec']:>10.2f}"
+                  f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}{rss:>14}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
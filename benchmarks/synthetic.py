@@ -0,0 +1,40 @@
+"""生成模拟mpv截图的文件夹：文件名为字幕文本，内容为1080p图片"""
+import os
+import random
+
+from PIL import Image, ImageDraw
+
+JP_WORDS = ["喚く", "胸", "連絡", "忘れる", "聞く", "走る", "静か", "危ない", "約束", "景色"]
+EN_WORDS = ["swelling", "dormant", "overlook", "wavelength", "ominous", "gradual", "mine", "sword"]
+
+
+def make_subtitle(index, word, mode):
+    if mode == "jp":
+        return f"第{index}話 ここで{word}のは難しい"
+    return f"Line {index} where the {word} appears"
+
+
+def generate_folder(folder, count, mode="jp", size=(1920, 1080), seed=0):
+    """生成count张截图，返回 [(文件名, 单词)]，相同参数生成的内容完全一致
+
+    mode为mixed时日语和英语截图交替出现。
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    jobs = []
+    for index in range(count):
+        item_mode = mode if mode != "mixed" else ("jp" if index % 2 == 0 else "en")
+        word = rng.choice(JP_WORDS if item_mode == "jp" else EN_WORDS)
+        filename = f"{make_subtitle(index, word, item_mode)}.png"
+        path = os.path.join(folder, filename)
+        if not os.path.exists(path):
+            img = Image.new("RGB", size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            draw = ImageDraw.Draw(img)
+            # 加入随机色块，使压缩耗时接近真实画面
+            for _ in range(40):
+                x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+                x1, y1 = x0 + rng.randrange(50, 600), y0 + rng.randrange(50, 400)
+                draw.rectangle((x0, y0, x1, y1), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            img.save(path, format="PNG")
+        jobs.append((filename, word))
+    return jobs
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ExplanationCache:
+    """大模型解析结果的本地SQLite缓存（按最近使用时间LRU淘汰，超过有效期自动过期）"""
+
+    def __init__(self, db_path, max_entries=5000, max_age_days=90, evict_every=100):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 3600
+        # 淘汰需要排序整张表，启动时执行一次，之后每写入evict_every条再执行，条目数可能暂时略超max_entries
+        self.evict_every = max(1, evict_every)
+        self.puts_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # 多个工作线程共用同一连接，由self.lock串行化访问
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS explanations (
+            cache_key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL
+        )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON explanations (accessed)")
+        self.conn.commit()
+        self.evict()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据config.ini的[cache]部分创建缓存，未启用时返回None"""
+        if not config.getboolean("cache", "enabled", fallback=True):
+            return None
+        path = config.get("cache", "path", fallback="cache/explanations.sqlite3")
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(__file__), path)
+        return cls(
+            path,
+            max_entries=config.getint("cache", "max_entries", fallback=5000),
+            max_age_days=config.getint("cache", "max_age_days", fallback=90)
+        )
+
+    @staticmethod
+    def make_key(mode, model_name, prompt_version, subtitle, key):
+        """由模式、模型名、提示词版本、例句和单词生成缓存键"""
+        raw = json.dumps([mode, model_name, prompt_version, subtitle, key], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, cache_key):
+        """命中时返回解析结果并刷新访问时间，未命中或已过期返回None"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result, created FROM explanations WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE explanations SET accessed = ? WHERE cache_key = ?", (now, cache_key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, cache_key, result):
+        """写入解析结果（仅缓存成功的结果）"""
+        if result.get("error"):
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO explanations (cache_key, result, created, accessed) VALUES (?, ?, ?, ?)",
+                (cache_key, json.dumps(result, ensure_ascii=False), now, now)
+            )
+            self.conn.commit()
+            self.puts_since_evict += 1
+            if self.puts_since_evict < self.evict_every:
+                return
+        self.evict()
+
+    def evict(self):
+        """删除过期条目，并按最近使用时间只保留max_entries条"""
+        with self.lock:
+            self.puts_since_evict = 0
+            self.conn.execute("DELETE FROM explanations WHERE created < ?", (time.time() - self.max_age,))
+            self.conn.execute(
+                "DELETE FROM explanations WHERE cache_key IN ("
+                "SELECT cache_key FROM explanations ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self.conn.commit()
+
+    def stats(self):
+        """返回命中/未命中次数及当前条目数"""
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": size}
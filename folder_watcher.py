@@ -0,0 +1,110 @@
+import os
+import threading
+
+try:
+    # 可选依赖：安装watchdog后使用系统文件通知（Linux下为inotify，Windows下为ReadDirectoryChangesW）
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class _NewFileHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.add_candidate(os.path.basename(event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.add_candidate(os.path.basename(event.dest_path))
+
+
+class FolderWatcher:
+    """监视截图文件夹，新图片写入完成后通过on_new_files(文件名列表)回调通知（在后台线程中调用）
+
+    已知文件不会重复通知；watchdog不可用时退化为定时扫描目录。
+    新文件需在两次检查间大小不变才视为写入完成，避免读取到mpv尚未写完的截图。
+    """
+
+    def __init__(self, folder_path, on_new_files, valid_extensions, known_files=(), poll_interval=1.0):
+        self.folder_path = folder_path
+        self.on_new_files = on_new_files
+        self.valid_extensions = tuple(valid_extensions)
+        self.known = set(known_files)
+        self.poll_interval = poll_interval
+        self.candidates = {}  # 文件名 -> 上次检查时的文件大小
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.observer = None
+        self.thread = None
+
+    @property
+    def uses_notifications(self):
+        return self.observer is not None
+
+    def start(self):
+        if Observer is not None:
+            try:
+                self.observer = Observer()
+                self.observer.schedule(_NewFileHandler(self), self.folder_path, recursive=False)
+                self.observer.start()
+            except Exception as e:
+                print(f"文件通知不可用，改为定时扫描: {e}")
+                self.observer = None
+        if self.observer is not None:
+            # 文件通知只报告之后的变化，补扫一次打开文件夹后、开始监视前保存的截图（已知文件不会重复添加）
+            self._scan()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer = None
+
+    def add_candidate(self, filename):
+        if os.path.splitext(filename)[1].lower() not in self.valid_extensions:
+            return
+        with self.lock:
+            if filename not in self.known and filename not in self.candidates:
+                self.candidates[filename] = -1
+
+    def _scan(self):
+        try:
+            names = os.listdir(self.folder_path)
+        except OSError as e:
+            print(f"扫描文件夹失败: {self.folder_path} - {e}")
+            return
+        for filename in names:
+            self.add_candidate(filename)
+
+    def _run(self):
+        while not self.stop_event.wait(self.poll_interval):
+            if self.observer is None:
+                self._scan()
+
+            ready = []
+            with self.lock:
+                for filename, last_size in list(self.candidates.items()):
+                    path = os.path.join(self.folder_path, filename)
+                    try:
+                        size = os.path.getsize(path)
+                        create_time = os.path.getctime(path)
+                    except OSError:
+                        del self.candidates[filename]  # 文件已被删除或改名
+                        continue
+                    if size > 0 and size == last_size:
+                        del self.candidates[filename]
+                        self.known.add(filename)
+                        ready.append((create_time, filename))
+                    else:
+                        self.candidates[filename] = size
+
+            if ready:
+                ready.sort()  # 按创建时间排序，与load_folder一致
+                self.on_new_files([filename for _, filename in ready])
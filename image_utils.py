@@ -0,0 +1,262 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from PIL import Image
+
+from media_manifest import MediaManifest
+from metrics import metrics
+
+# 预压缩暂存文件的保留天数（源文件或压缩参数改变后旧文件不再使用，超过该天数后删除）
+STAGED_MAX_AGE_DAYS = 7
+
+
+def compress_image(img_path, max_width, max_height, quality):
+    """把图片缩放到不超过max_width x max_height并编码为JPEG，返回字节数据
+
+    定义在模块顶层，以便在子进程中执行。
+    """
+    return compress_image_timed(img_path, max_width, max_height, quality)[0]
+
+
+def compress_image_timed(img_path, max_width, max_height, quality):
+    """同compress_image，额外返回解码缩放和JPEG编码各自的耗时（毫秒）
+
+    子进程中无法直接记录统计，由主进程根据返回的耗时补记。
+    """
+    t0 = time.perf_counter()
+    with Image.open(img_path) as img:
+        img.thumbnail((max_width, max_height))
+
+        if img.mode in ('RGBA', 'LA'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        else:
+            img = img.convert('RGB')
+
+        t1 = time.perf_counter()
+        img_buffer = BytesIO()
+        img.save(img_buffer, format='JPEG', quality=quality)
+        t2 = time.perf_counter()
+        return img_buffer.getvalue(), (t1 - t0) * 1000, (t2 - t1) * 1000
+
+
+def compress_to_file(img_path, out_path, max_width, max_height, quality):
+    """压缩图片并写入out_path（先写临时文件再改名，读取方不会读到不完整的文件），返回字节数"""
+    data = compress_image(img_path, max_width, max_height, quality)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+    return len(data)
+
+
+def lower_priority():
+    """后台预压缩进程的初始化函数：降低进程优先级，避免与界面和创建卡片时的压缩争抢CPU"""
+    try:
+        if hasattr(os, "nice"):
+            os.nice(10)
+        elif sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), 0x4000)  # BELOW_NORMAL_PRIORITY_CLASS
+    except Exception:
+        pass
+
+
+def shutdown_executor(executor):
+    """不等待地停止进程池并取消排队中的任务（cancel_futures需要Python 3.9，3.8上只能由调用方取消已记录的Future）"""
+    try:
+        executor.shutdown(wait=False, cancel_futures=True)
+    except TypeError:
+        executor.shutdown(wait=False)
+
+
+class ImageCompressor:
+    """基于进程池的图片压缩阶段，可在大模型解析期间并行压缩所有选中的截图
+
+    设置staging_dir后可在打开文件夹时用低优先级的后台进程预压缩（precompress），结果按源文件路径、
+    修改时间、大小和压缩参数命名保存在staging_dir中，创建卡片时直接读取，源文件或参数改变后自动失效。
+    """
+
+    def __init__(self, max_width, max_height, quality, max_workers=0, staging_dir=None, background_workers=1):
+        self.max_width = max_width
+        self.max_height = max_height
+        self.quality = quality
+        self.settings = f"{max_width}x{max_height}q{quality}"  # 压缩参数，作为暂存文件和媒体清单键的一部分
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = None
+        self.staging_dir = staging_dir
+        self.background_workers = max(1, int(background_workers))
+        self.background_executor = None
+        self.background = {}  # 暂存文件路径 -> 后台预压缩的Future
+        self.closed = False  # shutdown()后不再接受预压缩
+        self.lock = threading.Lock()
+
+    def _get_executor(self):
+        # 首次使用时再启动进程池，避免只浏览图片时也创建子进程
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self.executor
+
+    def staged_path(self, img_path):
+        """返回该截图按当前参数预压缩的暂存文件路径，未设置暂存目录或源文件不存在时返回None"""
+        if not self.staging_dir:
+            return None
+        source_key = MediaManifest.source_key(img_path, self.settings)
+        return os.path.join(self.staging_dir, f"{source_key}.jpg") if source_key else None
+
+    @staticmethod
+    def _read_staged(staged):
+        try:
+            with open(staged, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def precompress(self, img_paths):
+        """用低优先级的后台进程依次预压缩尚无暂存文件的截图，返回提交的数量"""
+        if not self.staging_dir:
+            return 0
+        os.makedirs(self.staging_dir, exist_ok=True)
+        submitted = 0
+        with self.lock:
+            if self.closed:
+                return 0
+            if self.background_executor is None:
+                self.background_executor = ProcessPoolExecutor(
+                    max_workers=self.background_workers, initializer=lower_priority
+                )
+            for img_path in img_paths:
+                staged = self.staged_path(img_path)
+                if not staged or staged in self.background or os.path.exists(staged):
+                    continue
+                future = self.background_executor.submit(
+                    compress_to_file, img_path, staged, self.max_width, self.max_height, self.quality
+                )
+                self.background[staged] = future
+                future.add_done_callback(lambda f, staged=staged: self._background_done(staged, f))
+                submitted += 1
+        return submitted
+
+    def _background_done(self, staged, future):
+        with self.lock:
+            if self.background.get(staged) is future:
+                del self.background[staged]
+
+    def cancel_precompress(self):
+        """取消尚未开始的预压缩（如切换文件夹时）"""
+        # cancel()会同步调用完成回调_background_done，该回调需要获取self.lock，因此在锁外取消
+        with self.lock:
+            futures = list(self.background.values())
+        for future in futures:
+            future.cancel()
+
+    def discard(self, img_path):
+        """删除已上传截图的暂存文件"""
+        staged = self.staged_path(img_path)
+        if staged:
+            try:
+                os.remove(staged)
+            except OSError:
+                pass
+
+    def prune_staged(self, max_age_days=STAGED_MAX_AGE_DAYS):
+        """删除超过max_age_days天未更新的暂存文件（对应的源文件或压缩参数已改变）"""
+        if not self.staging_dir or not os.path.isdir(self.staging_dir):
+            return 0
+        cutoff = time.time() - max_age_days * 24 * 3600
+        removed = 0
+        for name in os.listdir(self.staging_dir):
+            path = os.path.join(self.staging_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def submit(self, img_path):
+        """提交压缩任务，返回Future，用result()取出JPEG字节数据
+
+        已有预压缩结果时直接读取；后台预压缩已开始时等待其完成后读取，尚未开始的取消后立即压缩。
+        """
+        staged = self.staged_path(img_path)
+        if staged:
+            with self.lock:
+                background = self.background.pop(staged, None)
+            if background is not None and background.cancel():
+                background = None
+            if background is not None:
+                return self._after_background(background, staged, img_path)
+            data = self._read_staged(staged)
+            if data is not None:
+                future = Future()
+                future.set_result((data, 0.0, 0.0))
+                return future
+        return self._get_executor().submit(
+            compress_image_timed, img_path, self.max_width, self.max_height, self.quality
+        )
+
+    def _after_background(self, background, staged, img_path):
+        """返回在后台预压缩完成后读取暂存文件的Future，预压缩失败时改为立即压缩"""
+        future = Future()
+
+        def copy_result(source):
+            if source.exception() is not None:
+                future.set_exception(source.exception())
+            else:
+                future.set_result(source.result())
+
+        def on_background_done(done):
+            data = self._read_staged(staged) if not done.cancelled() and done.exception() is None else None
+            if data is not None:
+                future.set_result((data, 0.0, 0.0))
+                return
+            try:
+                self._get_executor().submit(
+                    compress_image_timed, img_path, self.max_width, self.max_height, self.quality
+                ).add_done_callback(copy_result)
+            except Exception as e:
+                future.set_exception(e)
+
+        background.add_done_callback(on_background_done)
+        return future
+
+    async def result(self, future):
+        """在事件循环中等待submit返回的Future，记录解码和编码耗时，返回JPEG字节数据"""
+        with metrics.span("media.wait_compress"):
+            data, decode_ms, encode_ms = await asyncio.wrap_future(future)
+        self._record(decode_ms, encode_ms)
+        return data
+
+    def compress(self, img_path):
+        """在当前线程内直接压缩（已有预压缩结果时直接读取）"""
+        staged = self.staged_path(img_path)
+        data = self._read_staged(staged) if staged else None
+        if data is not None:
+            return data
+        data, decode_ms, encode_ms = compress_image_timed(img_path, self.max_width, self.max_height, self.quality)
+        self._record(decode_ms, encode_ms)
+        return data
+
+    @staticmethod
+    def _record(decode_ms, encode_ms):
+        metrics.record("media.decode", decode_ms)
+        metrics.record("media.encode", encode_ms)
+
+    def shutdown(self):
+        """停止两个进程池并取消排队中的压缩，否则解释器退出时会等待全部排队的任务完成"""
+        with self.lock:
+            self.closed = True
+            executors = [e for e in (self.executor, self.background_executor) if e is not None]
+            self.executor = self.background_executor = None
+        self.cancel_precompress()
+        for executor in executors:
+            shutdown_executor(executor)
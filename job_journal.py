@@ -0,0 +1,178 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 每张截图已完成的阶段，按处理顺序排列
+STAGES = ('pending', 'explained', 'media_stored', 'written')
+# 不再需要继续的阶段：已写入、不可重试的失败、被之后的新任务（相同截图和单词）取代
+FINAL_STAGES = ('written', 'failed', 'superseded')
+_FINAL = ", ".join(f"'{stage}'" for stage in FINAL_STAGES)
+
+
+class JobJournal:
+    """批量任务的本地SQLite日志：记录每张截图完成到哪个阶段及其结果
+
+    程序关闭或Anki中途断开后，下次启动可从每张截图最后完成的阶段继续，
+    已付费得到的解析结果和已上传的图片不会丢失。同一截图和单词重新创建时，旧任务中未完成的条目被新任务取代。
+    """
+
+    def __init__(self, db_path, keep_days=7):
+        self.db_path = db_path
+        self.keep_days = keep_days
+        self.lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # 多个线程共用同一连接，由self.lock串行化访问
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folder TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            created REAL NOT NULL,
+            finished INTEGER NOT NULL DEFAULT 0
+        )""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS items (
+            job_id INTEGER NOT NULL,
+            idx INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            word TEXT NOT NULL,
+            mode TEXT,
+            stage TEXT NOT NULL,
+            result TEXT,
+            media TEXT,
+            status TEXT,
+            updated REAL NOT NULL,
+            PRIMARY KEY (job_id, idx)
+        )""")
+        # 旧版本的日志中语言模式只记录在任务上，补充每张截图的mode列
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(items)")]
+        if "mode" not in columns:
+            self.conn.execute("ALTER TABLE items ADD COLUMN mode TEXT")
+        self.conn.commit()
+        self.prune()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据config.ini的[journal]部分创建日志，未启用时返回None"""
+        if not config.getboolean("journal", "enabled", fallback=True):
+            return None
+        path = config.get("journal", "path", fallback="cache/jobs.sqlite3")
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(__file__), path)
+        return cls(path, keep_days=config.getint("journal", "keep_days", fallback=7))
+
+    def create_job(self, folder, paths, words, modes):
+        """登记一个新任务，modes为每张截图的语言模式，返回job_id"""
+        now = time.time()
+        with self.lock:
+            # 旧任务中相同截图和单词的未完成条目由新任务处理，避免之后恢复旧任务时重复写入
+            self.conn.executemany(
+                f"UPDATE items SET stage = 'superseded', updated = ? WHERE path = ? AND word = ? "
+                f"AND stage NOT IN ({_FINAL}) AND job_id IN (SELECT job_id FROM jobs WHERE finished = 0)",
+                [(now, path, word) for path, word in zip(paths, words)]
+            )
+            self.conn.execute(
+                f"UPDATE jobs SET finished = 1 WHERE finished = 0 AND NOT EXISTS "
+                f"(SELECT 1 FROM items i WHERE i.job_id = jobs.job_id AND i.stage NOT IN ({_FINAL}))"
+            )
+            # 任务上的mode只用于展示（如"en,jp"），恢复时使用每张截图各自的模式
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (folder, mode, created) VALUES (?, ?, ?)", (folder, ",".join(sorted(set(modes))), now)
+            )
+            job_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO items (job_id, idx, path, word, mode, stage, updated) VALUES (?, ?, ?, ?, ?, 'pending', ?)",
+                [(job_id, i, path, word, mode, now) for i, (path, word, mode) in enumerate(zip(paths, words, modes))]
+            )
+            self.conn.commit()
+        return job_id
+
+    def unfinished_jobs(self):
+        """返回未完成的任务列表：job_id、folder、mode、created、total（总张数）、remaining（待继续的张数）"""
+        with self.lock:
+            rows = self.conn.execute(f"""
+                SELECT j.job_id, j.folder, j.mode, j.created, COUNT(*), SUM(i.stage NOT IN ({_FINAL}))
+                FROM jobs j JOIN items i ON i.job_id = j.job_id
+                WHERE j.finished = 0 GROUP BY j.job_id ORDER BY j.job_id
+            """).fetchall()
+        return [
+            {"job_id": r[0], "folder": r[1], "mode": r[2], "created": r[3], "total": r[4], "remaining": r[5]}
+            for r in rows
+        ]
+
+    def load_job(self, job_id):
+        """返回任务信息和按下标排列的条目（含mode/stage/result/media/status），任务不存在返回None"""
+        with self.lock:
+            job = self.conn.execute(
+                "SELECT folder, mode FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            rows = self.conn.execute(
+                "SELECT idx, path, word, stage, result, media, status, mode FROM items WHERE job_id = ? ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+        if job is None:
+            return None
+        return {
+            "job_id": job_id,
+            "folder": job[0],
+            "mode": job[1],
+            "items": [
+                {"index": r[0], "path": r[1], "word": r[2], "stage": r[3],
+                 "result": json.loads(r[4]) if r[4] else None, "media": r[5], "status": r[6],
+                 "mode": r[7] or job[1]}
+                for r in rows
+            ]
+        }
+
+    def _update(self, job_id, index, **values):
+        values["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in values)
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE items SET {columns} WHERE job_id = ? AND idx = ?", (*values.values(), job_id, index)
+            )
+            self.conn.commit()
+
+    def mark_explained(self, job_id, index, result):
+        self._update(job_id, index, stage='explained', result=json.dumps(result, ensure_ascii=False))
+
+    def mark_media(self, job_id, index, media_filename):
+        self._update(job_id, index, stage='media_stored', media=media_filename)
+
+    def mark_written(self, job_id, index, status):
+        self._update(job_id, index, stage='written', status=status)
+
+    def mark_failed(self, job_id, index, status, final=False):
+        """记录失败状态：可重试的失败阶段保持不变，恢复时从该阶段重试；final为True时不再继续"""
+        if final:
+            self._update(job_id, index, stage='failed', status=status)
+        else:
+            self._update(job_id, index, status=status)
+
+    def finish_job(self, job_id, force=False):
+        """全部条目都不需要继续时（或force为True，如用户放弃恢复）把任务标记为已完成"""
+        with self.lock:
+            if not force:
+                remaining = self.conn.execute(
+                    f"SELECT COUNT(*) FROM items WHERE job_id = ? AND stage NOT IN ({_FINAL})", (job_id,)
+                ).fetchone()[0]
+                if remaining:
+                    return False
+            self.conn.execute("UPDATE jobs SET finished = 1 WHERE job_id = ?", (job_id,))
+            self.conn.commit()
+        return True
+
+    def prune(self):
+        """删除keep_days天前已完成的任务"""
+        cutoff = time.time() - self.keep_days * 24 * 3600
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM items WHERE job_id IN (SELECT job_id FROM jobs WHERE finished = 1 AND created < ?)",
+                (cutoff,)
+            )
+            self.conn.execute("DELETE FROM jobs WHERE finished = 1 AND created < ?", (cutoff,))
+            self.conn.commit()
@@ -1,14 +1,22 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
 import os
 import requests
 import base64
 import json
 import threading  # 导入线程模块
+import queue
 import configparser  # 新增导入configparser模块
 from openai_utils import OpenAIExplanation
 from anki_connect import AnkiConnect  # 新增导入
+from explain_cache import ExplanationCache
+from job_journal import JobJournal
+from metrics import metrics
+from thumbnail_cache import ThumbnailCache
+from screenshot_grid import ScreenshotGrid, ScreenshotRow
+from folder_watcher import FolderWatcher
+from pipeline import CardPipeline, detect_mode, openai_options
+from prefetch import ExplanationPrefetcher, prefetch_options
 
 
 class ImageViewerApp:
@@ -47,6 +55,12 @@ class ImageViewerApp:
         # 新增：删除所有图片按钮（在切换模式按钮右侧）
         self.delete_btn = ttk.Button(self.toolbar, text="删除所有图片", command=self.delete_all_images)
         self.delete_btn.pack(side=tk.LEFT, padx=5, pady=5)
+
+        # 新增：监视文件夹按钮，自动添加mpv新保存的截图
+        self.watch_btn = ttk.Button(self.toolbar, text="监视文件夹", command=self.toggle_watch)
+        self.watch_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        self.watcher = None
+        self.watch_queue = queue.Queue()  # 监视线程发现的新文件，由主线程取出添加到列表
         self.anki_connect = AnkiConnect()  # 初始化AnkiConnect实例
         
         # 新增：打开配置文件按钮（在删除所有图片按钮右侧）
@@ -72,23 +86,6 @@ class ImageViewerApp:
         # self.mode_label.pack(side=tk.LEFT, padx=5, pady=5)
 
 
-        # 创建主内容区域
-        self.canvas = tk.Canvas(self.root)
-        self.scrollbar = ttk.Scrollbar(self.root, orient=tk.VERTICAL, command=self.canvas.yview)
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-
-        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        self.content_frame = ttk.Frame(self.canvas)
-        self.canvas.create_window((0, 0), window=self.content_frame, anchor=tk.NW)
-
-        self.canvas.bind("<Configure>", self.on_canvas_configure)
-        self.content_frame.bind("<Configure>", self.on_frame_configure)
-
-        for i in range(4):
-            self.content_frame.columnconfigure(i, weight=1, uniform="cols")
-
         # 从外置INI文件读取OpenAI配置（替换原硬编码）
         config = configparser.ConfigParser()
         config_path = os.path.join(os.path.dirname(__file__), "config.ini")  # 定位项目根目录的config.ini
@@ -96,26 +93,46 @@ class ImageViewerApp:
             messagebox.showerror("配置错误", f"未找到配置文件 {config_path}\n请按照文档创建配置文件")
             raise FileNotFoundError(f"配置文件 {config_path} 不存在")
         config.read(config_path, encoding="utf-8")
-        self.openai_config = {
-            "api_key": config.get("openai", "api_key"),
-            "base_url": config.get("openai", "base_url"),
-            "model_name": config.get("openai", "model_name")
-        }
-
+        self.openai_config = openai_options(config)  # 修改：与命令行共用同一套配置读取
+        self.prefetch_config = prefetch_options(config)  # 新增：输入单词时在后台预解析
+        self.prefetch_after = {}  # 行数据 -> 等待输入停顿的after任务ID
+
+        self.explain_cache = ExplanationCache.from_config(config)  # 新增：解析结果缓存（未启用时为None）
+        metrics.configure_from_config(config)  # 新增：各阶段耗时统计（[metrics] enabled为true时开启）
+        self.journal = JobJournal.from_config(config)  # 新增：任务日志，中断的任务可在下次启动时继续
+        # 新增：缩略图磁盘缓存
+        thumbnail_dir = config.get("cache", "thumbnail_dir", fallback="cache/thumbnails")
+        if not os.path.isabs(thumbnail_dir):
+            thumbnail_dir = os.path.join(os.path.dirname(__file__), thumbnail_dir)
+        self.thumbnail_cache = ThumbnailCache(thumbnail_dir, size=(100, 100))
         self.openai_client = None
+        self.pipeline = None  # 与命令行共用的卡片处理引擎（首次创建卡片时初始化）
+
+        # 创建主内容区域（修改：虚拟化列表，只为可见行创建组件）
+        self.screenshot_grid = ScreenshotGrid(
+            self.root,
+            thumbnail_loader=self.thumbnail_cache.load,
+            on_create=self.handle_button_click,
+            on_open_image=self.open_image,
+            decode_workers=config.getint("cache", "thumbnail_workers", fallback=4),
+            on_word_change=self.schedule_prefetch
+        )
+        self.screenshot_grid.pack(fill=tk.BOTH, expand=True)
+        self.watch_interval = config.getfloat("watch", "poll_interval", fallback=1.0)
 
-
-    def on_canvas_configure(self, event):
-        self.canvas.itemconfig("frame", width=event.width)
-
-    def on_frame_configure(self, event):
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        # 新增：处理引擎在后台事件循环中运行，进度经队列交回Tk主线程
+        self.progress_queue = queue.Queue()
+        self.jobs = set()  # 进行中的任务（concurrent.futures.Future），关闭窗口时取消
+        self.root.after(50, self.poll_progress_queue)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        if self.journal:
+            self.root.after(200, self.offer_resume)
 
     def load_folder(self):
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-        self.file_info = []  # 清空历史记录
-        self.check_vars = []  # 清空确认框状态
+        self.stop_watch()
+        self.cancel_prefetch()
+        self.anki_connect.cancel_precompress()  # 新增：上一个文件夹尚未开始的预压缩不再需要
+        self.screenshot_grid.set_rows([])  # 清空历史记录
 
         self.folder_path = filedialog.askdirectory()  # 保存文件夹路径
         self.anki_connect.folder_path = self.folder_path
@@ -137,155 +154,238 @@ class ImageViewerApp:
         image_files_with_time.sort(key=lambda x: x[1])
         image_files = [item[0] for item in image_files_with_time]  # 提取排序后的文件名列表
 
-        # 修改列配置为5列（确认框+原4列）
-        for i in range(5):
-            self.content_frame.columnconfigure(i, weight=1, uniform="cols")
-
-        # 新增：添加标题行（row=0）
-        title_config = [
-            ("确认框", 0),   # 列0：确认框标题
-            ("图片", 1),     # 列1：图片标题
-            ("文件名", 2),   # 列2：文件名标题
-            ("单词", 3),     # 列3：单词输入框标题
-            ("操作", 4)      # 列4：操作按钮标题
-        ]
-        for text, col in title_config:
-            title_label = ttk.Label(
-                self.content_frame,
-                text=text,
-                font=('微软雅黑', 10, 'bold'),  # 加粗字体更醒目
-                anchor="center"  # 文字居中显示
-            )
-            title_label.grid(row=0, column=col, sticky="nsew", padx=5, pady=5)
-
-        # 调整图片行从row=1开始循环（原row从0开始，现改为start=1）
-        for row, filename in enumerate(image_files, start=1):
-            # 新增：确认框列（调整sticky参数为居中）
-            check_var = tk.BooleanVar()
-            self.check_vars.append(check_var)
-            check_btn = ttk.Checkbutton(self.content_frame, variable=check_var)
-            check_btn.grid(row=row, column=0, sticky="", padx=5, pady=5)  # 列0
-
-            # 原组件列号后移1位（0→1, 1→2, 2→3, 3→4）
-            img_path = os.path.join(self.folder_path, filename)
-            try:
-                with Image.open(img_path) as img:
-                    img.thumbnail((100, 100))
-                    tk_img = ImageTk.PhotoImage(img)
-            except Exception as e:
-                print(f"无法加载图片: {img_path} - {e}")
-                continue
-
-            img_label = ttk.Label(self.content_frame, image=tk_img)
-            img_label.image = tk_img
-            # 新增：绑定图片点击事件
-            img_label.bind("<Button-1>", lambda event, path=img_path: self.open_image(path))
-            img_label.grid(row=row, column=1, sticky="nsew", padx=5, pady=5)  # 列1
-
-            # 原name_label（第三列）修改为可换行、可选中的Text组件（新增居中对齐）
-            text_widget = tk.Text(
-                self.content_frame,
-                wrap="word",  # 按单词自动换行
-                width=20,      # 宽度（约20个字符）
-                height=3,      # 高度（最多3行）
-                state="disabled",  # 只读状态
-                bg="systembuttonface",  # 背景色与系统按钮一致
-                bd=0,          # 无边框
-                font=ttk.Style().lookup("TLabel", "font")  # 继承Label字体
-            )
-            # 插入文本时临时启用编辑状态
-            text_widget.config(state="normal")
-            # 修改：去除文件名后缀
-            base_name = os.path.splitext(filename)[0]  # 获取不带扩展名的文件名
-            text_widget.insert("1.0", base_name)  # 插入处理后的文件名
-            text_widget.config(state="disabled")  # 恢复只读状态
-            text_widget.grid(row=row, column=2, sticky="nsew", padx=5, pady=5)  # 列2
-
-            input_entry = ttk.Entry(self.content_frame)
-            input_entry.grid(row=row, column=3, sticky="nsew", padx=5, pady=5)  # 列3（对应"单词"标题列）
-
-            action_btn = tk.Button(
-                self.content_frame,
-                text="创建卡片",
-                state="normal"
-            )
-            action_btn['command'] = lambda f=filename, e=input_entry, btn=action_btn: self.handle_button_click(f, e, btn)
-            action_btn.grid(row=row, column=4, sticky="nsew", padx=5, pady=5)  # 列4（对应"操作"标题列）
-
-            # 保存当前行信息（无需修改file_info，因为不影响后续逻辑）
-            self.file_info.append( (filename, input_entry, action_btn) )
-
-        self.content_frame.rowconfigure(len(image_files) + 1, weight=1)  # 调整行权重（标题行+文件行）
-
-    def handle_button_click(self, filename, input_entry, btn):
-        user_input = input_entry.get().strip()
+        # 修改：只创建轻量的行数据，组件和缩略图在滚动到可见区域时才创建
+        self.screenshot_grid.set_rows([ScreenshotRow(self.folder_path, filename) for filename in image_files])
+        # 新增：在后台用低优先级进程预压缩全部截图，创建卡片时直接上传
+        self.anki_connect.precompress([row.img_path for row in self.screenshot_grid.rows])
+
+    def toggle_watch(self):
+        """开始/停止监视当前文件夹，新截图出现时追加到列表末尾（不重新扫描或解码已有行）"""
+        if self.watcher:
+            self.stop_watch()
+            return
+        if not self.folder_path:
+            messagebox.showinfo("提示", "请先选择需要监视的文件夹")
+            return
+
+        self.watcher = FolderWatcher(
+            self.folder_path,
+            on_new_files=self.watch_queue.put,
+            valid_extensions=('.png', '.jpg', '.jpeg', '.gif', '.bmp'),
+            known_files=[row.filename for row in self.screenshot_grid.rows],
+            poll_interval=self.watch_interval
+        )
+        self.watcher.start()
+        print(f"开始监视文件夹：{self.folder_path}（{'文件通知' if self.watcher.uses_notifications else '定时扫描'}）")
+        self.watch_btn.config(text="停止监视")
+        self.watch_after_id = self.root.after(200, self.poll_watch_queue)
+
+    def stop_watch(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+            self.root.after_cancel(self.watch_after_id)
+            print("已停止监视文件夹")
+        self.watch_btn.config(text="监视文件夹")
+
+    def poll_watch_queue(self):
+        new_rows = []
+        try:
+            while True:
+                for filename in self.watch_queue.get_nowait():
+                    new_rows.append(ScreenshotRow(self.folder_path, filename))
+        except queue.Empty:
+            pass
+        if new_rows:
+            print(f"发现 {len(new_rows)} 张新截图")
+            self.screenshot_grid.append_rows(new_rows)
+            self.anki_connect.precompress([row.img_path for row in new_rows])
+        self.watch_after_id = self.root.after(200, self.poll_watch_queue)
+
+    def handle_button_click(self, row, btn):
+        user_input = row.word.strip()
         if not user_input:
             messagebox.showerror("输入错误", "请输入内容后再创建卡片")
             return
 
         btn.config(state="disabled")
-
-
-        # 延迟初始化OpenAI客户端
-        if not self.openai_client:
-            print("第一次初始化OpenAI客户端")
-            self.openai_client = OpenAIExplanation(**self.openai_config)
-            self.anki_connect.openai_client = self.openai_client  # 传递给AnkiConnect
-
-        if(ord(user_input[0]) > 10000):
-            print("当前模式为日语模式")
-            self.anki_connect.set_mode("jp")
-            self.openai_client.mode = "jp"
-        else:
-            print("当前模式为英语模式")
-            self.anki_connect.set_mode("en")
-            self.openai_client.mode = "en"
-
-        self.anki_connect.create_anki_card(filename, user_input, btn)  # 调用新模块方法
+        self.start_cards([row.filename], [user_input], [btn])
 
     def batch_add_cards(self):
         selected = []
-        for idx, check_var in enumerate(self.check_vars):
-            if check_var.get() and idx < len(self.file_info):
-                filename, input_entry, action_btn = self.file_info[idx]
-                user_input = input_entry.get().strip()
+        for idx, row in enumerate(self.screenshot_grid.rows):
+            if row.checked:
+                user_input = row.word.strip()
                 if not user_input:
                     messagebox.showerror("输入错误", f"第 {idx+1} 行的输入内容不能为空")
                     return
-                action_btn.config(state="disabled")
-                selected.append((filename, user_input, action_btn))
+                selected.append((row.filename, user_input, self.screenshot_grid.button(row)))
 
         if not selected:
             messagebox.showinfo("提示", "请先选择需要批量添加的行")
             return
 
+        for _, _, action_btn in selected:
+            action_btn.config(state="disabled")
         filenames, user_inputs, buttons = zip(*selected)
-        # 延迟初始化OpenAI客户端
-        if not self.openai_client:
+        self.start_cards(filenames, user_inputs, buttons)
+
+    def get_pipeline(self, show_error=True):
+        """延迟初始化OpenAI客户端和卡片处理引擎，失败时（show_error为True时弹窗提示）返回None"""
+        if not self.pipeline:
             print("第一次初始化OpenAI客户端")
-            self.openai_client = OpenAIExplanation(**self.openai_config)
-            self.anki_connect.openai_client = self.openai_client  # 传递给AnkiConnect
+            try:
+                self.openai_client = OpenAIExplanation(**self.openai_config, cache=self.explain_cache)
+            except RuntimeError as e:
+                if show_error:
+                    messagebox.showerror("初始化失败", str(e))
+                return None
+            self.pipeline = CardPipeline(self.anki_connect, self.openai_client, journal=self.journal)
+            if self.prefetch_config["enabled"]:
+                self.pipeline.prefetcher = ExplanationPrefetcher(
+                    self.openai_client, self.pipeline.loop_thread,
+                    max_concurrent=self.prefetch_config["max_concurrent"],
+                    max_entries=self.prefetch_config["max_entries"]
+                )
+        return self.pipeline
+
+    def schedule_prefetch(self, row):
+        """单词输入停顿delay_ms毫秒后在后台预解析，期间继续输入则重新计时"""
+        if not self.prefetch_config["enabled"]:
+            return
+        after_id = self.prefetch_after.pop(row, None)
+        if after_id:
+            self.root.after_cancel(after_id)
+        self.prefetch_after[row] = self.root.after(self.prefetch_config["delay_ms"], self.prefetch_row, row)
+
+    def prefetch_row(self, row):
+        self.prefetch_after.pop(row, None)
+        word = row.word.strip()
+        if not word:
+            return
+        pipeline = self.get_pipeline(show_error=False)  # 输入时不弹窗，创建卡片时再提示
+        if pipeline and pipeline.prefetcher:
+            pipeline.prefetcher.request(os.path.splitext(row.filename)[0], word, detect_mode(word))
+
+    def cancel_prefetch(self):
+        """切换文件夹时取消等待中和进行中的预解析"""
+        for after_id in self.prefetch_after.values():
+            self.root.after_cancel(after_id)
+        self.prefetch_after.clear()
+        if self.pipeline and self.pipeline.prefetcher:
+            self.pipeline.prefetcher.cancel_all()
+
+    def start_cards(self, filenames, user_inputs, buttons):
+        """把任务提交到处理引擎的事件循环，通过进度回调更新各行按钮"""
+        pipeline = self.get_pipeline()
+        if not pipeline:
+            for btn in buttons:
+                btn.config(state="normal")
+            return
+
+        # 修改：按每行的单词分别判断语言，混合选择时日语和英语卡片各自使用对应的提示词和牌组
+        modes = [detect_mode(word) for word in user_inputs]
+
+        pending = set(range(len(buttons)))  # 尚未收到结果的行
 
-        if(ord(user_input[0]) > 10000):
-            print("当前模式为日语模式")
-            self.anki_connect.set_mode("jp")
-            self.openai_client.mode = "jp"
+        def on_progress(index, status):
+            # 在事件循环线程中调用，只放入队列，由poll_progress_queue在主线程中更新按钮
+            pending.discard(index)
+            self.progress_queue.put((buttons[index], status))
+
+        def on_done(future):
+            self.jobs.discard(future)
+            if not future.cancelled() and future.exception():
+                print(f"处理任务失败：{future.exception()}")
+                # 未收到结果的按钮恢复为可点击
+                for index in list(pending):
+                    self.progress_queue.put((buttons[index], 'create_failed'))
+
+        job = pipeline.submit(list(filenames), list(user_inputs), on_progress, modes=modes)
+        self.jobs.add(job)
+        job.add_done_callback(on_done)
+
+    def offer_resume(self):
+        """启动时若任务日志中有未完成的任务，询问是否继续"""
+        unfinished = self.journal.unfinished_jobs()
+        if not unfinished:
+            return
+        remaining = sum(job["remaining"] for job in unfinished)
+        folders = "\n".join(sorted({job["folder"] for job in unfinished}))
+        if not messagebox.askyesno(
+            "继续未完成的任务",
+            f"上次有 {len(unfinished)} 个任务未完成，共 {remaining} 张截图尚未制成卡片：\n{folders}\n\n"
+            "是否继续？（已解析的单词和已上传的图片不会重复处理）"
+        ):
+            for job in unfinished:
+                self.journal.finish_job(job["job_id"], force=True)
+            return
+
+        pipeline = self.get_pipeline()
+        if not pipeline:
+            return
+        for job in unfinished:
+            future = pipeline.resume(job["job_id"])
+            self.jobs.add(future)
+            future.add_done_callback(self.on_resume_done)
+
+    def on_resume_done(self, future):
+        """恢复的任务完成后（在事件循环线程中调用），把结果交给主线程提示"""
+        self.jobs.discard(future)
+        if future.cancelled():
+            return
+        if future.exception():
+            self.progress_queue.put((None, f"继续任务失败：{future.exception()}"))
         else:
-            print("当前模式为英语模式")
-            self.anki_connect.set_mode("en")
-            self.openai_client.mode = "en"
+            summary = future.result()
+            self.progress_queue.put((None, f"任务 {summary['job_id']} 已继续处理：成功 {summary['success']}/{summary['total']} 张"))
 
-        self.anki_connect.create_anki_cards(filenames, user_inputs, buttons)  # 调用新模块方法
+    def poll_progress_queue(self):
+        """在Tk主线程中取出处理进度并更新按钮（按钮为None时为需要提示的消息）"""
+        try:
+            while True:
+                btn, status = self.progress_queue.get_nowait()
+                if btn is None:
+                    messagebox.showinfo("任务", status)
+                else:
+                    self.report_status(btn, status)
+        except queue.Empty:
+            pass
+        self.root.after(50, self.poll_progress_queue)
+
+    def on_close(self):
+        """关闭窗口时取消进行中的任务并停止后台事件循环"""
+        self.stop_watch()
+        for job in list(self.jobs):
+            job.cancel()
+        if self.pipeline:
+            self.pipeline.close()  # 关闭HTTP连接池并停止后台事件循环
+        self.anki_connect.compressor.shutdown()  # 取消尚未完成的预压缩，窗口关闭后程序立即退出
+        self.root.destroy()
+
+    @staticmethod
+    def report_status(btn, status):
+        """根据处理状态更新按钮显示"""
+        if status == 'created':
+            btn.config(bg='green', text='已创建')
+        elif status == 'updated':
+            btn.config(bg='green', text='已更新')
+        elif status == 'update_failed':
+            btn.config(state="normal", text="更新失败")
+        else:
+            btn.config(state="normal", text="创建失败")
 
     def select_all(self):
         """一键勾选所有第一列确认框"""
-        for check_var in self.check_vars:
-            check_var.set(True)  # 设置为选中状态
+        for row in self.screenshot_grid.rows:
+            row.checked = True  # 设置为选中状态
+        self.screenshot_grid.redraw()
 
     def select_none(self):
         """一键取消所有第一列确认框的勾选"""
-        for check_var in self.check_vars:
-            check_var.set(False)  # 设置为未选中状态
+        for row in self.screenshot_grid.rows:
+            row.checked = False  # 设置为未选中状态
+        self.screenshot_grid.redraw()
 
     # 新增：切换模式方法
 
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def media_filename(base_name, data, ext=".jpg"):
+    """按内容生成媒体文件名：{原文件名}_{内容哈希前12位}{扩展名}，不同内容的文件不会互相覆盖"""
+    return f"{base_name}_{hashlib.sha1(data).hexdigest()[:12]}{ext}"
+
+
+class UploadedMedia:
+    """已上传到Anki媒体库的文件记录（本地SQLite），图片清单和发音缓存共用
+
+    用户可能在Anki中清理了未使用的媒体，每次启动后首次使用记录前，AnkiConnect按pattern
+    调用getMediaFilesNames核对一次（见retain）；核对前verified为False，不应信任记录。
+    """
+    table = None  # 保存上传记录的表（含filename列）
+    pattern = None  # getMediaFilesNames的文件名模式
+    label = "媒体文件"
+
+    def __init__(self, db_path, schema):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.verified = False
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # 多个线程共用同一连接，由self.lock串行化访问
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        for statement in schema:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def is_uploaded(self, filename):
+        """媒体库中是否已有该文件名（文件名带内容哈希，相同即内容相同）"""
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT 1 FROM {self.table} WHERE filename = ? LIMIT 1", (filename,)
+            ).fetchone() is not None
+
+    def retain(self, existing_names):
+        """只保留仍存在于Anki媒体库中的记录（本地文件保留，需要时重新上传），返回删除的条数"""
+        existing_names = set(existing_names)
+        with self.lock:
+            rows = self.conn.execute(f"SELECT DISTINCT filename FROM {self.table}").fetchall()
+            missing = [(name,) for name, in rows if name not in existing_names]
+            self.conn.executemany(f"DELETE FROM {self.table} WHERE filename = ?", missing)
+            self.conn.commit()
+            self.verified = True
+        return len(missing)
+
+
+class MediaManifest(UploadedMedia):
+    """记录已上传到Anki媒体库的图片，再次上传同一截图时跳过压缩和上传
+
+    source_key由源文件路径、修改时间、大小和压缩参数决定，源文件或压缩参数变化后自动失效。
+    """
+    table = "media"
+    pattern = "*.jpg"
+    label = "图片"
+
+    def __init__(self, db_path):
+        super().__init__(db_path, (
+            """CREATE TABLE IF NOT EXISTS media (
+                source_key TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                uploaded REAL NOT NULL
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_filename ON media (filename)"
+        ))
+
+    @classmethod
+    def from_config(cls, config):
+        """根据config.ini的[cache] media_manifest创建清单，留空时返回None"""
+        path = config.get("cache", "media_manifest", fallback="cache/media_manifest.sqlite3")
+        if not path:
+            return None
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(__file__), path)
+        return cls(path)
+
+    @staticmethod
+    def source_key(img_path, settings):
+        """由源文件的绝对路径、修改时间、大小和压缩参数生成键；文件不存在时返回None"""
+        try:
+            stat = os.stat(img_path)
+        except OSError:
+            return None
+        raw = f"{os.path.abspath(img_path)}|{stat.st_mtime_ns}|{stat.st_size}|{settings}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, source_key):
+        """返回该源文件已上传的媒体文件名，未上传返回None"""
+        if source_key is None:
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT filename FROM media WHERE source_key = ?", (source_key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, source_key, filename):
+        if source_key is None:
+            return
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO media (source_key, filename, uploaded) VALUES (?, ?, ?)",
+                (source_key, filename, time.time())
+            )
+            self.conn.commit()
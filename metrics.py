@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 耗时直方图的桶上限（毫秒），最后一个桶收集其余全部
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, float("inf"))
+
+
+class Histogram:
+    """按固定桶统计耗时分布"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, pct):
+        """返回第pct百分位所在桶的上限（最后一个桶返回最大值）"""
+        target = self.count * pct / 100
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if n and seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """各处理阶段的耗时统计：内存中的直方图，以及可选的JSON Lines追踪文件（每个span一行）"""
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.trace = None
+        self.lock = threading.Lock()
+
+    def configure(self, enabled, trace_path=None):
+        with self.lock:
+            self.enabled = enabled
+            if self.trace:
+                self.trace.close()
+                self.trace = None
+            if enabled and trace_path:
+                trace_dir = os.path.dirname(trace_path)
+                if trace_dir:
+                    os.makedirs(trace_dir, exist_ok=True)
+                self.trace = open(trace_path, "a", encoding="utf-8")
+
+    def configure_from_config(self, config):
+        """根据config.ini的[metrics]部分开启统计"""
+        trace_path = config.get("metrics", "trace_file", fallback="")
+        if trace_path and not os.path.isabs(trace_path):
+            trace_path = os.path.join(os.path.dirname(__file__), trace_path)
+        self.configure(config.getboolean("metrics", "enabled", fallback=False), trace_path or None)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """统计一段代码的耗时；with语句内可向产出的字典追加属性（如token用量）"""
+        if not self.enabled:
+            yield attrs
+            return
+        start = time.time()
+        t0 = time.perf_counter()
+        error = None
+        try:
+            yield attrs
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.record(name, (time.perf_counter() - t0) * 1000, start, error, attrs)
+
+    def record(self, name, duration_ms, start=None, error=None, attrs=None):
+        """记录一次已知耗时的操作（如在子进程中测得的耗时）"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.histograms.setdefault(name, Histogram()).add(duration_ms)
+            if self.trace:
+                entry = {
+                    "name": name,
+                    "start": start if start is not None else time.time() - duration_ms / 1000,
+                    "duration_ms": round(duration_ms, 3),
+                    "thread": threading.current_thread().name
+                }
+                if error:
+                    entry["error"] = error
+                if attrs:
+                    entry.update(attrs)
+                self.trace.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                self.trace.flush()
+
+    def summary(self):
+        """返回各阶段的次数、平均/最大耗时及p50/p90/p99（毫秒）"""
+        with self.lock:
+            return {
+                name: {
+                    "count": h.count,
+                    "avg_ms": h.total / h.count,
+                    "p50_ms": h.percentile(50),
+                    "p90_ms": h.percentile(90),
+                    "p99_ms": h.percentile(99),
+                    "max_ms": h.max
+                }
+                for name, h in self.histograms.items()
+            }
+
+    def print_summary(self):
+        if not self.enabled or not self.histograms:
+            return
+        print("各阶段耗时统计（毫秒）：")
+        for name, stat in sorted(self.summary().items()):
+            print(f"  {name:<28} 次数 {stat['count']:>5}  平均 {stat['avg_ms']:>9.1f}  "
+                  f"p50 {stat['p50_ms']:>8.1f}  p99 {stat['p99_ms']:>8.1f}  最大 {stat['max_ms']:>9.1f}")
+
+
+def usage_attrs(usage):
+    """从模型响应的usage中提取token用量"""
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None)
+    }
+
+
+# 进程内共享的统计实例
+metrics = Metrics()
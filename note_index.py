@@ -0,0 +1,115 @@
+import asyncio
+import math
+import time
+
+
+def normalize_word(value):
+    """索引键：去掉首尾空白并忽略大小写（与Anki字段搜索的匹配方式一致）"""
+    return (value or "").strip().casefold()
+
+
+class NoteIndex:
+    """按牌组维护的 单词字段值 → 笔记ID 本地索引，用内存查找代替逐张卡片的findNotes查询
+
+    每个牌组首次使用时通过一次findNotes和分块notesInfo全量建立；之后根据自己新建的笔记
+    实时更新，并每隔resync_interval秒用"edited:N"只拉取最近修改过的笔记，
+    以同步在Anki中手动新增或修改的笔记。只在处理引擎的事件循环中使用。
+    """
+
+    def __init__(self, client, word_field, resync_interval=60.0, chunk_size=500):
+        self.client = client
+        self.word_field = word_field
+        self.resync_interval = resync_interval
+        self.chunk_size = chunk_size
+        self.decks = {}  # 牌组名 -> {"words": {键: 笔记ID集合}, "ids": {笔记ID: 键}, "synced": 时间戳}
+        self.lock = None  # 同步过程中的asyncio.Lock，在事件循环中创建
+
+    async def _request(self, action, **params):
+        """发送请求并返回result，失败时抛出RuntimeError"""
+        response = await self.client.request(action, **params)
+        if not response or response.get('error') or response.get('result') is None:
+            raise RuntimeError(f"{action} 失败: {response.get('error') if response else '无响应'}")
+        return response['result']
+
+    @staticmethod
+    def _deck_query(deck):
+        return 'deck:"{}"'.format(deck.replace('"', '\\"'))
+
+    async def _fetch(self, query):
+        """返回满足query的 {笔记ID: 单词字段值}"""
+        note_ids = await self._request('findNotes', query=query)
+        words = {}
+        for i in range(0, len(note_ids), self.chunk_size):
+            for note in await self._request('notesInfo', notes=note_ids[i:i + self.chunk_size]):
+                if note and 'noteId' in note and self.word_field in note.get('fields', {}):
+                    words[note['noteId']] = note['fields'][self.word_field]['value']
+        return words
+
+    def _set(self, entry, note_id, value):
+        key = normalize_word(value)
+        old_key = entry["ids"].get(note_id)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self._discard(entry, note_id)
+        entry["ids"][note_id] = key
+        entry["words"].setdefault(key, set()).add(note_id)
+
+    @staticmethod
+    def _discard(entry, note_id):
+        key = entry["ids"].pop(note_id, None)
+        if key is None:
+            return
+        ids = entry["words"].get(key)
+        if ids:
+            ids.discard(note_id)
+            if not ids:
+                del entry["words"][key]
+
+    async def ensure(self, deck):
+        """确保牌组索引可用：首次使用时全量建立，超过同步间隔时增量同步；失败返回False"""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            entry = self.decks.get(deck)
+            now = time.time()
+            if entry is not None and now - entry["synced"] < self.resync_interval:
+                return True
+            try:
+                if entry is None:
+                    start = time.perf_counter()
+                    entry = {"words": {}, "ids": {}, "synced": now}
+                    for note_id, value in (await self._fetch(self._deck_query(deck))).items():
+                        self._set(entry, note_id, value)
+                    self.decks[deck] = entry
+                    print(f"已建立牌组[{deck}]的单词索引：{len(entry['ids'])} 条笔记，"
+                          f"耗时 {time.perf_counter() - start:.2f} 秒")
+                else:
+                    # edited:N 的单位为天，向上取整，保证覆盖上次同步以来的全部修改
+                    days = max(1, math.ceil((now - entry["synced"]) / 86400))
+                    changed = await self._fetch(f'{self._deck_query(deck)} edited:{days}')
+                    for note_id, value in changed.items():
+                        self._set(entry, note_id, value)
+                    entry["synced"] = now
+            except RuntimeError as e:
+                print(f"同步牌组[{deck}]的单词索引失败：{e}")
+                return deck in self.decks  # 增量同步失败时继续使用已有索引
+            return True
+
+    def lookup(self, deck, word):
+        """返回牌组中单词字段为word的笔记ID（有多条时取最早创建的），不存在返回None"""
+        entry = self.decks.get(deck)
+        ids = entry["words"].get(normalize_word(word)) if entry else None
+        return min(ids) if ids else None
+
+    def add(self, deck, word, note_id):
+        """记录本程序新建的笔记"""
+        entry = self.decks.get(deck)
+        if entry is not None:
+            self._set(entry, note_id, word)
+
+    def forget(self, deck, note_id):
+        """移除已在Anki中删除的笔记"""
+        entry = self.decks.get(deck)
+        if entry is not None:
+            self._discard(entry, note_id)
@@ -1,8 +1,39 @@
+import asyncio
 import json
-import sys
-import tkinter as tk
-from tkinter import messagebox
-from openai import OpenAI
+import re
+import time
+from openai import AsyncOpenAI, BadRequestError
+
+from metrics import metrics, usage_attrs
+from rate_limiter import RateLimiter
+
+# 提示词版本号：修改提示词模板后需递增，使旧的缓存结果失效
+PROMPT_VERSION = 2
+# 批量响应中缺失或无法解析的单词对，最多单独重新请求的轮数
+MAX_REREQUESTS = 2
+
+CODE_FENCE = re.compile(r"```[\w-]*[ \t]*\n?(.*?)```", re.S)
+# 字段之间缺少的逗号：值结束后换行直接开始下一个键（JSON字符串内不能有原始换行，因此不会误改字符串内容）
+MISSING_COMMA = re.compile(r'(["\d\]}]|true|false|null)([ \t]*\r?\n\s*)(?=")')
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def strip_code_fence(text):
+    """去掉代码块标记（```json、``` 等），没有代码块时原样返回"""
+    match = CODE_FENCE.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+def load_json(text):
+    """解析JSON文本，失败时修复常见的格式错误（字段间缺少逗号、多余的结尾逗号）后再试一次，仍失败返回None"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(TRAILING_COMMA.sub(r"\1", MISSING_COMMA.sub(r"\1,\2", text)))
+    except json.JSONDecodeError:
+        return None
 
 
 class OpenAIExplanation:
@@ -17,27 +48,39 @@ class OpenAIExplanation:
 
 
 class OpenAIExplanation:
-    def __init__(self, api_key, base_url, model_name):
+    def __init__(self, api_key, base_url, model_name, batch_size=10, max_workers=4, stream=True, cache=None,
+                 max_concurrency=None, requests_per_minute=0, tokens_per_minute=0, max_retries=5, json_mode="auto"):
         self.api_key = api_key
         self.base_url = base_url
         self.model_name = model_name
-        self.mode = "jp"
+        self.batch_size = max(1, int(batch_size))  # 新增：每个子批次包含的单词对数量
+        self.max_workers = max(1, int(max_workers))  # 新增：同时发送的子批次请求数量（自适应并发的初始值）
+        # 新增：请求调度（请求数/token限速、自适应并发、限流后退避重试）
+        self.limiter = RateLimiter(
+            self.max_workers, max_concurrency=max_concurrency, requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute, max_retries=max_retries
+        )
+        self.stream = stream  # 新增：批量查询是否使用流式响应（边生成边解析）
+        self.cache = cache  # 新增：解析结果缓存（ExplanationCache实例，可为None）
+        # 新增：是否要求接口返回JSON对象（auto/true/false），auto在接口不支持时自动关闭
+        self.json_mode = str(json_mode).strip().lower()
         self.client = self._init_client()
 
+    def _cache_key(self, mode, subtitle, key):
+        return self.cache.make_key(mode, self.model_name, PROMPT_VERSION, subtitle, key)
+
     def _init_client(self):
-        """初始化 OpenAI 客户端"""
+        """初始化 OpenAI 异步客户端（只能在处理引擎的事件循环中使用）"""
         try:
-            return OpenAI(
+            # 重试由self.limiter统一调度，关闭SDK自带的重试以免重复等待
+            return AsyncOpenAI(
                 api_key=self.api_key,
-                base_url=self.base_url
+                base_url=self.base_url,
+                max_retries=0
             )
         except Exception as e:
-            # 创建一个隐藏的主窗口
-            root = tk.Tk()
-            root.withdraw()
-            # 显示错误弹窗
-            messagebox.showerror("初始化失败", f"OpenAI 客户端初始化失败: {str(e)}")
-            sys.exit(1)  # 显示错误信息并退出程序，返回状态码 1 表示异常退出
+            # 不在此处弹窗，由调用方（界面或命令行）决定如何提示
+            raise RuntimeError(f"OpenAI 客户端初始化失败: {str(e)}") from e
 
     # ... 已有代码 ...
 
@@ -59,8 +102,8 @@ class OpenAIExplanation:
 {{
     "单词": "喚く",
     "音标": "わめく",
-    "意义": "①大声でさけぶ。②騒ぎ立てる。"
-    "例句": "連絡先 聞くの忘れたって　<b>わめいて</b>たよ"
+    "意义": "①大声でさけぶ。②騒ぎ立てる。",
+    "例句": "連絡先 聞くの忘れたって　<b>わめいて</b>たよ",
     "笔记": "「わめいてた」是动词「わめく」（叫嚷、吵闹）的过去进行时，表示“（当时）在大声抱怨/嚷嚷”。句中指对方因忘记询问联系方式而焦急或生气地吵闹，带有责备或夸张语气。"
 }}
 当前输入：
@@ -111,7 +154,7 @@ class OpenAIExplanation:
 4. 对应的例句，并将单词部分用<b>原词</b>的形式包围
 5. 用中文结合语境解释一下当前单词的意思
 
-请为每个例句-单词对返回独立的JSON对象，用数组格式返回所有结果：
+请为每个例句-单词对返回独立的JSON对象，用"序号"字段标明对应的对编号，所有对象放在"结果"数组中返回：
 示例输入：
 对1:
 例句：連絡先 聞くの忘れたって わめいてたよ
@@ -120,22 +163,24 @@ class OpenAIExplanation:
 例句：胸ぺッタンコのくせに
 单词：胸
 示例格式：
-[
+{{"结果": [
     {{
+        "序号": 1,
         "单词": "喚く",
         "音标": "わめく",
-        "意义": "①大声でさけぶ。②騒ぎ立てる。"
-        "例句": "連絡先 聞くの忘れたって　<b>わめいて</b>たよ"
+        "意义": "①大声でさけぶ。②騒ぎ立てる。",
+        "例句": "連絡先 聞くの忘れたって　<b>わめいて</b>たよ",
         "笔记": "「わめいてた」是动词「わめく」（叫嚷、吵闹）的过去进行时，表示“（当时）在大声抱怨/嚷嚷”。句中指对方因忘记询问联系方式而焦急或生气地吵闹，带有责备或夸张语气。"
     }},
     {{
+        "序号": 2,
         "单词": "胸",
         "音标": "むね",
         "意义": "①人や動物の体の前面の一部分。乳房がある部分。②心の中。内面的な感情。",
         "例句": "<b>胸</b>ぺッタンコのくせに",
         "笔记": "「胸」在这里指的是胸部，特指人体上半身的前部区域，在这个例句中具体指向平坦的胸部（即没有丰满的乳房）。语境中可能带有一些调侃或自嘲的意味，描述胸部平坦的状态。"
     }}
-]
+]}}
 
 需要分析的例句-单词对：
 {"".join(pair_descriptions)}
@@ -158,7 +203,7 @@ class OpenAIExplanation:
     4. 当前的例句，并将和单词的部分用<b>{key}</b>的形式包围
     5. 用中文结合语境解释一下当前单词的意思
 
-    请为每个例句-单词对返回独立的JSON对象，用数组格式返回所有结果：
+    请为每个例句-单词对返回独立的JSON对象，用"序号"字段标明对应的对编号，所有对象放在"结果"数组中返回：
     示例输入：
     对1:
     例句：The Demon Sword's wavelength seems to be......swelling
@@ -167,135 +212,391 @@ class OpenAIExplanation:
     例句：We don't want to overlook any dormant mines
     单词：dormant
     示例格式：
-    [
+    {{"结果": [
         {{
+            "序号": 1,
             "单词": "swell",
             "音标": "英[swel]美[swɛl]",
             "意义": "to expand or increase in intensity, size, or power, often implying a gradual or ominous buildup",
             "例句": "The Demon Sword's wavelength seems to be......<b>swelling</b>",
-            "笔记": "「swelling」在这里并非指物理上的膨胀”，而是形容恶魔之剑的波长（可能指其能量波动或魔力）正在增强、扩大或变得不稳定。这暗示剑的力量在逐渐蓄积或失控，可能预示着即将爆发的危险或更强大的攻击性"
+            "笔记": "「swelling」在这里并非指物理上的“膨胀”，而是形容恶魔之剑的波长（可能指其能量波动或魔力）正在增强、扩大或变得不稳定。这暗示剑的力量在逐渐蓄积或失控，可能预示着即将爆发的危险或更强大的攻击性"
         }},
         {{
+            "序号": 2,
             "单词": "dormant",
             "音标": "英[ˈdɔ:mənt]美[ˈdɔrmənt]",
             "意义": "temporarily inactive or inactive for a period of time, but with the potential to become active again",
             "例句": "We don't want to overlook any <b>dormant</b> mines",
             "笔记": "「dormant」在这里形容矿井暂时处于不活跃或停用状态，但仍有潜在危险。这些矿井可能未被完全废弃，虽然表面上看似安全，但内部可能残留爆炸物、有毒气体或结构隐患（如塌方风险）。"
         }}
-    ]
+    ]}}
 
     需要分析的例句-单词对：
     {"".join(pair_descriptions)}
     """
 
     def parse_response(self, response_text):
-        """解析响应文本，提取 JSON 数据"""
+        """解析响应文本，提取 JSON 数据
+
+        兼容任意代码块标记和字段间缺少逗号等常见错误；整体仍无法解析时（如前后夹杂说明文字）
+        返回其中第一个格式正确的对象。
+        """
+        json_str = strip_code_fence(response_text)
+        data = load_json(json_str)
+        if data is None:
+            for obj_text in JSONArrayStreamParser().feed(json_str):
+                data = load_json(obj_text)
+                if data is not None:
+                    break
+        if data is None:
+            print(f"JSON解析失败，原始响应：{response_text}")
+        return data
+
+    @staticmethod
+    def _is_complete(info):
+        """结果对象是否包含必需的字段"""
+        return isinstance(info, dict) and bool(info.get("单词")) and bool(info.get("意义"))
+
+    def _parse_item(self, obj_text, order, placed, count):
+        """解析批量响应中的第order个对象，返回 (子批次内下标, 结果)；无法解析、不完整或重复时返回None
+
+        优先按"序号"字段对应到单词对，缺失或无效时按对象出现的顺序。
+        """
+        info = load_json(obj_text)
+        if not self._is_complete(info):
+            print(f"跳过无法解析的对象：{obj_text[:200]}")
+            return None
         try:
-            # 处理可能的代码块格式（如 ```json...```）
-            if response_text.startswith("```json") and response_text.endswith("```"):
-                json_str = response_text[7:-3].strip()
-            else:
-                json_str = response_text.strip()
-
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
-            print(f"JSON解析失败：{str(e)}")
-            print(f"原始响应：{response_text}")
+            pos = int(info.get("序号")) - 1
+        except (TypeError, ValueError):
+            pos = -1
+        if not 0 <= pos < count or pos in placed:
+            pos = order
+        if not 0 <= pos < count or pos in placed:
             return None
+        return pos, self._format_result(info)
+
+    async def _create(self, messages, **kwargs):
+        """发送chat.completions请求；开启JSON模式时要求返回JSON对象，
+        json_mode为auto且接口不接受该参数时，本次运行中改用普通输出并重发"""
+        if self.json_mode in ("auto", "true"):
+            try:
+                return await self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=0.1,
+                    response_format={"type": "json_object"},
+                    **kwargs
+                )
+            except BadRequestError as e:
+                # 只有参数错误与response_format有关时才回退，其他400（如超出上下文长度、内容审核）原样抛出
+                if self.json_mode != "auto" or not self._rejects_json_mode(e):
+                    raise
+                print(f"接口不支持JSON模式，改用普通输出：{str(e)}")
+                self.json_mode = "false"
+        return await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=0.1,
+            **kwargs
+        )
+
+    @staticmethod
+    def _rejects_json_mode(error):
+        """400错误是否由接口不支持response_format（JSON模式）引起"""
+        text = " ".join(str(part) for part in (
+            getattr(error, "param", None), getattr(error, "code", None), getattr(error, "message", None) or error
+        ) if part).lower()
+        return "response_format" in text or "json_object" in text
+
+    @staticmethod
+    def _estimate_tokens(messages, items):
+        """粗略估计一次请求的token数（提示词按每2个字符1个token，每个单词的结果约300个token），
+        收到响应后按实际用量修正"""
+        return sum(len(m["content"]) for m in messages) // 2 + 300 * items
+
+    async def _wait_retry(self, attempt, error, delay):
+        print(f"大模型请求失败（{str(error)}），{delay:.1f} 秒后重试"
+              f"（第 {attempt + 1}/{self.limiter.max_retries} 次）")
+        metrics.record("llm.retry_wait", delay * 1000,
+                       attrs={"status": getattr(error, "status_code", None), "attempt": attempt + 1})
+        await asyncio.sleep(delay)
+
+    async def _request(self, messages, span_name, mode, items=1):
+        """占用限流名额发送一次非流式请求，不重试"""
+        async with self.limiter.slot(self._estimate_tokens(messages, items)) as slot:
+            with metrics.span(span_name, mode=mode, items=items) as span:
+                response = await self._create(messages, stream=False)
+                usage = getattr(response, "usage", None)
+                span.update(usage_attrs(usage))
+            slot.record_usage(usage)
+        return response
+
+    async def _complete(self, messages, span_name, mode, items=1):
+        """发送非流式请求；被限流、超时或连接失败时按退避策略重试，重试用尽后抛出最后一个异常"""
+        attempt = 0
+        while True:
+            try:
+                return await self._request(messages, span_name, mode, items)
+            except Exception as e:
+                delay = self.limiter.retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                await self._wait_retry(attempt, e, delay)
+                attempt += 1
+
+    async def explain_single(self, subtitle, key, mode):
+        """调用 OpenAI API 解析单个单词信息，mode为语言模式（jp/en）"""
+        if self.cache:
+            cached = self.cache.get(self._cache_key(mode, subtitle, key))
+            if cached:
+                print(f"缓存命中：{key}")
+                return cached
 
-    def explain_single(self, subtitle, key):
-        """调用 OpenAI API 解析单个单词信息"""
         try:
-            if(self.mode == 'jp'):
+            if(mode == 'jp'):
                 prompt = self.construct_single_prompt_jp(subtitle, key)
                 language = "日语"
-            elif(self.mode == 'en'):
+            elif(mode == 'en'):
                 prompt = self.construct_single_prompt_en(subtitle, key)
                 language = "英语"
 
             print(f"正在查询单词：{key}")
-
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": f"你是一个专业的{language}词典助手，能够准确返回单词信息的JSON格式数据"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                stream=False
-            )
-
-            response_text = response.choices[0].message.content.strip()
-            print(f"收到原始响应：{response_text}")
-            word_info = self.parse_response(response_text)
-
-            if not word_info:
+            messages = [
+                {"role": "system", "content": f"你是一个专业的{language}词典助手，能够准确返回单词信息的JSON格式数据"},
+                {"role": "user", "content": prompt}
+            ]
+
+            # 响应无法解析或缺少字段时重新请求
+            for round_no in range(MAX_REREQUESTS + 1):
+                response = await self._complete(messages, "llm.explain_single", mode)
+                response_text = response.choices[0].message.content.strip()
+                print(f"收到原始响应：{response_text}")
+                word_info = self.parse_response(response_text)
+                if self._is_complete(word_info):
+                    break
+                if round_no < MAX_REREQUESTS:
+                    print(f"单词 {key} 的响应无法解析，重新请求")
+            else:
                 return {"error": "响应解析失败"}
 
-            return {
-                "word": word_info.get("单词", ""),
-                "pronunciation": word_info.get("音标", ""),
-                "meaning": word_info.get("意义", ""),
-                "example": word_info.get("例句", ""),
-                "note": word_info.get("笔记", ""),
-                "error": None
-            }
+            result = self._format_result(word_info)
+            if self.cache:
+                self.cache.put(self._cache_key(mode, subtitle, key), result)
+            return result
 
         except Exception as e:
             print(f"API调用失败：{str(e)}")
             return {"error": f"API调用失败：{str(e)}"}
 
-    def explain_batch(self, subtitles, keys):
-        """调用 OpenAI API 批量解析多对subtitle和key"""
+    async def explain_batch(self, subtitles, keys, mode):
+        """调用 OpenAI API 批量解析多对subtitle和key，按输入顺序返回结果列表"""
+        results = [None] * len(subtitles or [])
+        async for index, result in self.iter_batch(subtitles, keys, mode):
+            results[index] = result
+        return results
+
+    async def iter_batch(self, subtitles, keys, mode):
+        """批量解析同一语言模式（jp/en）的单词，按完成顺序逐个产出 (输入下标, 结果)
+
+        缓存命中的结果最先产出；未命中的按batch_size拆分为子批次并发请求（同时最多max_workers个），
+        开启流式模式时每收到一个完整的JSON对象就立即产出，无需等待整批返回。
+        请求被限流或中途失败时，子批次中尚未得到结果的单词对会在退避后重新请求；
+        响应中缺失或无法解析的单词对也会单独重新请求（最多MAX_REREQUESTS轮）。
+        """
         if not subtitles or not keys or len(subtitles) != len(keys):
             raise ValueError("subtitles和keys必须是相同长度的非空列表")
 
         pairs = list(zip(subtitles, keys))
 
+        # 先查缓存，只把未命中的单词对发送给模型
+        miss_indices = []
+        for i, (subtitle, key) in enumerate(pairs):
+            cached = self.cache.get(self._cache_key(mode, subtitle, key)) if self.cache else None
+            if cached:
+                yield i, cached
+            else:
+                miss_indices.append(i)
+        if not miss_indices:
+            print(f"批量查询的 {len(pairs)} 对单词全部命中缓存")
+            return
+
+        chunks = [miss_indices[i:i + self.batch_size] for i in range(0, len(miss_indices), self.batch_size)]
+        print(f"正在批量查询 {len(miss_indices)} 对单词（缓存命中 {len(pairs) - len(miss_indices)} 对），"
+              f"拆分为 {len(chunks)} 个子批次，并发数 {int(self.limiter.concurrency.limit)}，流式：{self.stream}")
+
+        # 各子批次作为任务并发运行，结果经队列汇总后按到达顺序产出
+        result_queue = asyncio.Queue()
+        tasks = [
+            asyncio.ensure_future(self._run_sub_batch([(i, pairs[i]) for i in chunk], result_queue, mode))
+            for chunk in chunks
+        ]
         try:
-            if(self.mode == 'jp'):
-                prompt = self.construct_batch_prompt_jp(pairs)
-                language = "日语"
-            elif(self.mode == 'en'):
-                prompt = self.construct_batch_prompt_en(pairs)
-                language = "英语"
-            print(f"正在批量查询 {len(pairs)} 对单词")
-
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system",
-                     "content": f"你是一个专业的{language}词典助手，能够准确返回多组单词信息的JSON格式数据数组"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                stream=False
-            )
-
-            response_text = response.choices[0].message.content.strip()
-            print(f"收到批量响应：{response_text[:200]}...")
-            results = self.parse_response(response_text)
-
-            if not results:
-                return [{"error": "批量响应解析失败"} for _ in pairs]
-
-            # 确保返回结果数量与请求的单词数量一致
-            formatted_results = []
-            for i, (subtitle, key) in enumerate(pairs):
-                if i < len(results) and isinstance(results[i], dict):
-                    formatted_results.append({
-                        "word": results[i].get("单词", ""),
-                        "pronunciation": results[i].get("音标", ""),
-                        "meaning": results[i].get("意义", ""),
-                        "example": results[i].get("例句", ""),
-                        "note": results[i].get("笔记", ""),
-                        "error": None
-                    })
-                else:
-                    formatted_results.append({"error": f"对 {subtitle} - {key} 的解析失败"})
-
-            return formatted_results
+            for _ in range(len(miss_indices)):
+                index, result = await result_queue.get()
+                if self.cache:
+                    self.cache.put(self._cache_key(mode, *pairs[index]), result)
+                yield index, result
+        finally:
+            # 调用方提前停止迭代（如任务被取消）时，取消仍在进行的子批次
+            for task in tasks:
+                task.cancel()
+
+    async def _run_sub_batch(self, indexed_pairs, result_queue, mode):
+        """执行单个子批次，把每个 (输入下标, 结果) 放入队列，保证每个下标恰好放入一次"""
+        indices = [i for i, _ in indexed_pairs]
+        pairs = [pair for _, pair in indexed_pairs]
+        done = set()
+        attempt = 0
+        rerequests = 0
+        sub_batch = self._stream_sub_batch if self.stream else self._explain_sub_batch
+        while len(done) < len(pairs):
+            # 重试时只请求尚未得到结果的单词对
+            pending = [pos for pos in range(len(pairs)) if pos not in done]
+            try:
+                async for sub_pos, result in sub_batch([pairs[pos] for pos in pending], mode):
+                    result_queue.put_nowait((indices[pending[sub_pos]], result))
+                    done.add(pending[sub_pos])
+            except Exception as e:
+                delay = self.limiter.retry_delay(attempt, e)
+                if delay is None:
+                    print(f"批量API调用失败：{str(e)}")
+                    for pos in range(len(pairs)):
+                        if pos not in done:
+                            result_queue.put_nowait((indices[pos], {"error": f"API调用失败：{str(e)}"}))
+                            done.add(pos)
+                    break
+                await self._wait_retry(attempt, e, delay)
+                attempt += 1
+                continue
+            missing = len(pairs) - len(done)
+            if not missing or rerequests >= MAX_REREQUESTS:
+                break
+            rerequests += 1
+            print(f"子批次中 {missing} 对单词的结果缺失或无法解析，重新请求这些单词")
+        # 重新请求后仍缺失的对象
+        for pos, (subtitle, key) in enumerate(pairs):
+            if pos not in done:
+                result_queue.put_nowait((indices[pos], {"error": f"对 {subtitle} - {key} 的解析失败"}))
+
+    def _batch_messages(self, pairs, mode):
+        """构造批量查询的对话消息"""
+        if(mode == 'jp'):
+            prompt = self.construct_batch_prompt_jp(pairs)
+            language = "日语"
+        elif(mode == 'en'):
+            prompt = self.construct_batch_prompt_en(pairs)
+            language = "英语"
+        return [
+            {"role": "system",
+             "content": f"你是一个专业的{language}词典助手，能够准确返回多组单词信息的JSON格式数据"},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def _format_result(info):
+        """把模型返回的中文键JSON对象转换为内部结果格式"""
+        return {
+            "word": info.get("单词", ""),
+            "pronunciation": info.get("音标", ""),
+            "meaning": info.get("意义", ""),
+            "example": info.get("例句", ""),
+            "note": info.get("笔记", ""),
+            "error": None
+        }
+
+    async def _explain_sub_batch(self, pairs, mode):
+        """解析单个子批次，产出其中格式正确的 (子批次内下标, 结果)，缺失或无法解析的单词对不产出"""
+        print(f"正在查询子批次 {len(pairs)} 对单词")
+        # 不在此处重试，失败由_run_sub_batch统一退避后只重试未得到结果的单词对
+        response = await self._request(self._batch_messages(pairs, mode), "llm.explain_batch", mode, items=len(pairs))
+
+        response_text = strip_code_fence(response.choices[0].message.content)
+        print(f"收到批量响应：{response_text[:200]}...")
+        placed = set()
+        for order, obj_text in enumerate(JSONArrayStreamParser().feed(response_text)):
+            item = self._parse_item(obj_text, order, placed, len(pairs))
+            if item:
+                placed.add(item[0])
+                yield item
+
+    async def _stream_sub_batch(self, pairs, mode):
+        """流式解析单个子批次，每收到一个格式正确的JSON对象就产出 (子批次内下标, 结果)"""
+        print(f"正在流式查询子批次 {len(pairs)} 对单词")
+        messages = self._batch_messages(pairs, mode)
+        # 开启统计或按token限速时，请求在最后一个分块中附带token用量
+        extra = {"stream_options": {"include_usage": True}} if metrics.enabled or self.limiter.track_tokens else {}
+        async with self.limiter.slot(self._estimate_tokens(messages, len(pairs))) as slot:
+            with metrics.span("llm.stream_batch", mode=mode, items=len(pairs)) as span:
+                start = time.perf_counter()
+                stream = await self._create(messages, stream=True, **extra)
+
+                parser = JSONArrayStreamParser()
+                order = 0
+                placed = set()
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        span.update(usage_attrs(chunk.usage))
+                        slot.record_usage(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    for obj_text in parser.feed(delta):
+                        item = self._parse_item(obj_text, order, placed, len(pairs))
+                        order += 1
+                        if not item:
+                            continue
+                        if not placed:
+                            span["first_item_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                        placed.add(item[0])
+                        yield item
+
+
+class JSONArrayStreamParser:
+    """增量解析流式返回的JSON，每凑齐一个结果对象就把它的文本交出
+
+    结果对象指数组中的对象（[{...}, {...}] 或 {"结果": [{...}]}），以及不在数组中、内部也没有结果对象的
+    顶层对象。只跟踪括号嵌套和字符串状态，因此前后的代码块标记或说明文字不影响解析，
+    某个对象内部的格式错误也不影响其后的对象。
+    """
 
-        except Exception as e:
-            print(f"批量API调用失败：{str(e)}")
-            return [{"error": f"API调用失败：{str(e)}"} for _ in pairs]
\ No newline at end of file
+    def __init__(self):
+        self.stack = []  # 未闭合的括号：[括号, 在buffer中的起始位置, 是否已交出过其中的结果对象]
+        self.in_string = False
+        self.escape = False
+        self.buffer = []
+
+    def feed(self, text):
+        """输入一段新文本，返回其中新完成的对象文本列表"""
+        completed = []
+        for ch in text:
+            if self.stack:
+                self.buffer.append(ch)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch == '"' and self.stack:
+                self.in_string = True
+            elif ch in "{[":
+                if not self.stack:
+                    self.buffer = [ch]
+                self.stack.append([ch, len(self.buffer) - 1, False])
+            elif ch in "}]" and self.stack:
+                bracket, begin, emitted = self.stack.pop()
+                if bracket != "{":
+                    continue
+                parent = self.stack[-1] if self.stack else None
+                if (parent is not None and parent[0] == "[") or (parent is None and not emitted):
+                    completed.append("".join(self.buffer[begin:]))
+                    for outer in self.stack:
+                        outer[2] = True
+                if not self.stack:
+                    self.buffer = []
+        return completed
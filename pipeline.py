@@ -0,0 +1,433 @@
+import argparse
+import asyncio
+import configparser
+import os
+import threading
+import time
+
+from anki_connect import AnkiConnect
+from explain_cache import ExplanationCache
+from job_journal import JobJournal
+from metrics import metrics
+from openai_utils import OpenAIExplanation
+
+VALID_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# 每张卡片的处理结果
+SUCCESS_STATUSES = ('created', 'updated')
+FAILURE_STATUSES = ('explain_failed', 'media_failed', 'create_failed', 'update_failed')
+# Anki无响应或上传失败等可在之后重试的失败：任务日志中保留为未完成，可用--resume继续
+RETRYABLE_STATUSES = ('media_failed', 'create_failed', 'update_failed')
+
+
+def detect_mode(word):
+    """根据单词判断语言模式：含有日文字符（码位大于10000）为日语，否则为英语"""
+    return "jp" if any(ord(ch) > 10000 for ch in word) else "en"
+
+
+def load_config():
+    """读取项目根目录的config.ini"""
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), "config.ini")
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"配置文件 {config_path} 不存在")
+    config.read(config_path, encoding="utf-8")
+    return config
+
+
+def openai_options(config):
+    """从配置中读取OpenAIExplanation的构造参数"""
+    return {
+        "api_key": config.get("openai", "api_key"),
+        "base_url": config.get("openai", "base_url"),
+        "model_name": config.get("openai", "model_name"),
+        "batch_size": config.getint("openai", "batch_size", fallback=10),  # 子批次大小
+        "max_workers": config.getint("openai", "max_workers", fallback=4),  # 子批次并发数
+        "stream": config.getboolean("openai", "stream", fallback=True),  # 批量查询使用流式响应
+        "max_concurrency": config.getint("openai", "max_concurrency", fallback=0) or None,  # 自适应并发上限
+        "requests_per_minute": config.getint("openai", "requests_per_minute", fallback=0),  # 每分钟请求数限制
+        "tokens_per_minute": config.getint("openai", "tokens_per_minute", fallback=0),  # 每分钟token数限制
+        "max_retries": config.getint("openai", "max_retries", fallback=5),  # 限流或连接失败后的最大重试次数
+        "json_mode": config.get("openai", "json_mode", fallback="auto")  # 要求接口返回JSON对象
+    }
+
+
+class EventLoopThread:
+    """在后台线程中运行的asyncio事件循环
+
+    处理引擎的所有协程都在这一个线程中运行，界面线程（Tk mainloop）和命令行通过
+    submit()/run()提交任务，不会被网络请求阻塞。
+    """
+
+    def __init__(self, name="card-pipeline"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """提交协程，立即返回concurrent.futures.Future（可等待结果或cancel()取消）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """提交协程并阻塞等待其结果"""
+        return self.submit(coro).result()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class CardPipeline:
+    """截图转Anki卡片的处理引擎：解析 → 压缩、下载发音 → 上传 → 写入，不依赖Tk
+
+    各阶段在同一个事件循环中并发运行，分别受并发上限约束：解析阶段为[openai] max_workers，
+    上传阶段为[anki] pool_size，下载发音为[audio] max_concurrent，写入阶段串行（见AnkiConnect.write_notes）。
+    每张截图的语言模式（jp/en）随任务传入或按单词判断，同一批次按语言拆分后并发解析，
+    各自使用对应的提示词和牌组，引擎本身不保存当前模式。
+    界面和命令行都通过run()/submit()使用同一套流程，进度经on_progress(下标, 状态)回调通知
+    （回调在事件循环线程中执行），状态取值见SUCCESS_STATUSES / FAILURE_STATUSES。
+    """
+
+    def __init__(self, anki_connect, explainer, loop_thread=None, journal=None, prefetcher=None):
+        self.anki_connect = anki_connect
+        self.explainer = explainer
+        self.loop_thread = loop_thread or EventLoopThread()
+        self.journal = journal  # 任务日志（JobJournal，可为None）
+        self.prefetcher = prefetcher  # 输入单词时的预解析（ExplanationPrefetcher，可为None）
+        self.media_limit = None  # 上传阶段的asyncio.Semaphore，在事件循环中创建
+
+    def run(self, filenames, words, on_progress=None, modes=None):
+        """处理一组截图，阻塞直到全部完成，返回统计信息"""
+        return self.loop_thread.run(self.run_async(filenames, words, on_progress, modes=modes))
+
+    def submit(self, filenames, words, on_progress=None, modes=None):
+        """在后台处理一组截图，立即返回Future（结果为统计信息）"""
+        return self.loop_thread.submit(self.run_async(filenames, words, on_progress, modes=modes))
+
+    async def aclose(self):
+        """关闭AnkiConnect和大模型的HTTP连接池"""
+        await self.anki_connect.aclose()
+        await self.explainer.client.close()
+
+    def close(self, timeout=5.0):
+        """关闭连接后停止事件循环，程序退出前调用（之后不能再提交任务）"""
+        try:
+            self.loop_thread.submit(self.aclose()).result(timeout)
+        except Exception as e:
+            print(f"关闭连接失败：{e}")
+        self.loop_thread.stop()
+
+    def resume(self, job_id, on_progress=None):
+        """在后台继续任务日志中未完成的任务，立即返回Future"""
+        return self.loop_thread.submit(self.resume_async(job_id, on_progress))
+
+    async def resume_async(self, job_id, on_progress=None):
+        job = self.journal.load_job(job_id)
+        if job is None:
+            raise ValueError(f"任务 {job_id} 不存在")
+        print(f"继续任务 {job_id}（{job['folder']}）")
+        return await self.run_async(
+            [item["path"] for item in job["items"]], [item["word"] for item in job["items"]],
+            on_progress, job_id=job_id, modes=[item["mode"] for item in job["items"]]
+        )
+
+    async def _explanations(self, raw_names, words, mode):
+        """按完成顺序产出 (下标, 解析结果)；单张卡片使用单词提示词"""
+        if len(raw_names) == 1:
+            yield 0, await self.explainer.explain_single(raw_names[0], words[0], mode)
+        else:
+            async for item in self.explainer.iter_batch(raw_names, words, mode):
+                yield item
+
+    async def run_async(self, filenames, words, on_progress=None, job_id=None, modes=None):
+        """处理一组截图，返回统计信息
+
+        modes为每张截图的语言模式（jp/en），省略时按单词判断。
+        开启任务日志时每张截图每完成一个阶段就记录一次。job_id为日志中已有的任务时，
+        从每张截图最后完成的阶段继续：已写入的直接报告原状态，已解析、已上传的跳过对应阶段，
+        已被之后的新任务取代的跳过（不计入总数）。只有可重试的失败（RETRYABLE_STATUSES）使任务保留为未完成。
+        """
+        modes = list(modes) if modes is not None else [detect_mode(word) for word in words]
+        if not len(filenames) == len(words) == len(modes):
+            raise ValueError("filenames、words和modes必须是相同长度的列表")
+        start = time.perf_counter()
+        counts = {status: 0 for status in SUCCESS_STATUSES + FAILURE_STATUSES}
+        journal = self.journal
+
+        def report(index, status, record=True):
+            counts[status] += 1
+            # 单张卡片从开始处理到写入完成的耗时
+            metrics.record("card.total", (time.perf_counter() - start) * 1000, attrs={"status": status})
+            if journal and record:
+                if status in SUCCESS_STATUSES:
+                    journal.mark_written(job_id, index, status)
+                else:
+                    journal.mark_failed(job_id, index, status, final=status not in RETRYABLE_STATUSES)
+            if on_progress:
+                on_progress(index, status)
+
+        if not filenames:
+            return self._summary(counts, 0, start)
+        if self.media_limit is None:
+            self.media_limit = asyncio.Semaphore(self.anki_connect.client.limits.max_connections)
+
+        # 统一使用绝对路径，任务日志恢复时不依赖当前打开的文件夹
+        paths = [os.path.abspath(os.path.join(self.anki_connect.folder_path, f)) for f in filenames]
+        raw_names = [os.path.splitext(os.path.basename(f))[0] for f in filenames]
+        saved = {}
+        if journal:
+            if job_id is None:
+                job_id = journal.create_job(os.path.abspath(self.anki_connect.folder_path), paths, words, modes)
+            else:
+                saved = {item["index"]: item for item in journal.load_job(job_id)["items"]}
+
+        # 按日志中已完成的阶段分配到各阶段的入口
+        to_explain, to_store, to_write = [], [], []
+        superseded = 0
+        for i in range(len(paths)):
+            item = saved.get(i)
+            stage = item["stage"] if item else "pending"
+            if stage == "superseded":
+                superseded += 1
+            elif stage in ("written", "failed"):
+                report(i, item["status"], record=False)
+            elif stage == "media_stored":
+                to_write.append((i, item["result"], item["media"]))
+            elif stage == "explained":
+                to_store.append((i, item["result"]))
+            else:
+                to_explain.append(i)
+        if saved:
+            print(f"已完成 {len(paths) - superseded - len(to_explain) - len(to_store) - len(to_write)} 张，"
+                  f"已由之后的任务处理 {superseded} 张，"
+                  f"待写入 {len(to_write)} 张，待上传 {len(to_store)} 张，待解析 {len(to_explain)} 张")
+
+        # 需要上传的图片先提交到进程池并行压缩，与大模型解析同时进行
+        need_media = [i for i, _ in to_store] + to_explain
+        compressed = dict(zip(need_media, await self.anki_connect.compress_files([paths[i] for i in need_media])))
+        write_queue = asyncio.Queue()
+
+        def store_audio(i, result):
+            # 发音下载和上传与图片同时进行，失败时卡片使用在线发音地址
+            return self.anki_connect.store_audio(result['word'], result['pronunciation'], modes[i])
+
+        async def store_image(i):
+            async with self.media_limit:
+                with metrics.span("media.store", file=filenames[i]):
+                    return await self.anki_connect.store_media_file(paths[i], compressed[i])
+
+        async def store_media(i, result):
+            media_result, audio_filename = await asyncio.gather(store_image(i), store_audio(i, result))
+            # 没有响应（Anki无法连接）与返回错误一样按上传失败处理
+            if not media_result or not media_result.get('response') or media_result['response'].get('error'):
+                report(i, 'media_failed')
+                return
+            if journal:
+                journal.mark_media(job_id, i, media_result['filename'])
+            write_queue.put_nowait((i, result, media_result['filename'], audio_filename))
+
+        async def store_audio_only(i, result, media_filename):
+            # 图片已上传的条目（从日志恢复）只需取得发音，已下载过的直接使用本地缓存
+            write_queue.put_nowait((i, result, media_filename, await store_audio(i, result)))
+
+        async def write_notes():
+            finished = False
+            while not finished:
+                # 取出当前已上传完成的全部条目，按语言分组，每组用一组批量请求写入对应的牌组
+                group = [await write_queue.get()]
+                while not write_queue.empty():
+                    group.append(write_queue.get_nowait())
+                if None in group:
+                    finished = True
+                    group = [item for item in group if item is not None]
+                by_mode = {}
+                for item in group:
+                    by_mode.setdefault(modes[item[0]], []).append(item)
+                for mode, items in by_mode.items():
+                    try:
+                        with metrics.span("notes.write", items=len(items), mode=mode):
+                            statuses = await self.anki_connect.write_notes([item[1:] for item in items], mode)
+                    except Exception as e:
+                        # 一组写入出错不影响其他组和之后的条目
+                        print(f"写入笔记失败：{e}")
+                        statuses = ['create_failed'] * len(items)
+                    for (i, _, _, _), status in zip(items, statuses):
+                        report(i, status)
+
+        def explained(i, result):
+            # 每解析出一个单词就立即开始上传其图片，不等待整批解析完成
+            if result.get('error'):
+                report(i, 'explain_failed')
+                return
+            if journal:
+                journal.mark_explained(job_id, i, result)
+            media_tasks.append(asyncio.ensure_future(store_media(i, result)))
+
+        async def explain(mode, indices):
+            async for k, result in self._explanations([raw_names[i] for i in indices],
+                                                      [words[i] for i in indices], mode):
+                explained(indices[k], result)
+
+        async def explain_prefetched(i):
+            # 使用输入单词时已开始的预解析，进行中的等待其完成；预解析失败时重新解析
+            result = await self.prefetcher.get(raw_names[i], words[i], modes[i])
+            if result is None:
+                result = await self.explainer.explain_single(raw_names[i], words[i], modes[i])
+            else:
+                print(f"使用预解析结果：{words[i]}")
+            explained(i, result)
+
+        # 已有预解析的单独处理，其余按语言拆分为子批次，各自使用对应的提示词并发解析
+        prefetched = []
+        explain_groups = {}
+        for i in to_explain:
+            if self.prefetcher and self.prefetcher.has(raw_names[i], words[i], modes[i]):
+                prefetched.append(i)
+            else:
+                explain_groups.setdefault(modes[i], []).append(i)
+        if len(explain_groups) > 1:
+            print("本批次包含多种语言：" + "，".join(
+                f"{'日语' if mode == 'jp' else '英语'} {len(indices)} 张" for mode, indices in explain_groups.items()
+            ))
+
+        writer = asyncio.ensure_future(write_notes())
+        media_tasks = [asyncio.ensure_future(store_media(i, result)) for i, result in to_store]
+        media_tasks += [asyncio.ensure_future(store_audio_only(*item)) for item in to_write]
+        explain_tasks = [asyncio.ensure_future(explain(mode, indices)) for mode, indices in explain_groups.items()]
+        explain_tasks += [asyncio.ensure_future(explain_prefetched(i)) for i in prefetched]
+        try:
+            await asyncio.gather(*explain_tasks)
+            await asyncio.gather(*media_tasks)
+            write_queue.put_nowait(None)
+            await writer
+        finally:
+            # 被取消时一并取消尚未完成的解析、上传和写入
+            for task in explain_tasks + media_tasks + [writer]:
+                task.cancel()
+
+        if journal:
+            if journal.finish_job(job_id):
+                print(f"任务 {job_id} 已全部完成")
+            else:
+                retryable = sum(counts[status] for status in RETRYABLE_STATUSES)
+                print(f"任务 {job_id} 中有 {retryable} 张因Anki无响应或上传失败未完成，可稍后用 --resume 或重启程序继续")
+        summary = self._summary(counts, len(filenames) - superseded, start)
+        summary["job_id"] = job_id
+        print(f"处理完成：成功 {summary['success']}/{summary['total']} 张，"
+              f"耗时 {summary['elapsed']:.1f} 秒，{summary['cards_per_sec']:.2f} 张/秒")
+        print(f"AnkiConnect请求耗时统计：{self.anki_connect.client.stats()}")
+        metrics.print_summary()
+        return summary
+
+    @staticmethod
+    def _summary(counts, total, start):
+        elapsed = time.perf_counter() - start
+        success = sum(counts[status] for status in SUCCESS_STATUSES)
+        return {
+            "total": total,
+            "success": success,
+            "counts": counts,
+            "elapsed": elapsed,
+            "cards_per_sec": success / elapsed if elapsed > 0 else 0.0
+        }
+
+
+def read_jobs(folder, words_file=None, items=()):
+    """收集待处理的 (文件名, 单词)：来自words_file（每行"文件名<Tab>单词"）和"文件名=单词"形式的参数"""
+    jobs = []
+    if words_file:
+        with open(words_file, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.rstrip("\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                filename, sep, word = line.partition("\t")
+                if not sep or not word.strip():
+                    raise ValueError(f"{words_file} 第 {line_no} 行格式错误，应为：文件名<Tab>单词")
+                jobs.append((filename.strip(), word.strip()))
+    for item in items:
+        filename, sep, word = item.rpartition("=")
+        if not sep or not filename or not word.strip():
+            raise ValueError(f"参数格式错误，应为：文件名=单词（{item}）")
+        jobs.append((filename, word.strip()))
+
+    valid = []
+    for filename, word in jobs:
+        path = os.path.join(folder, filename)
+        if not os.path.isfile(path) or os.path.splitext(filename)[1].lower() not in VALID_EXTENSIONS:
+            print(f"跳过不存在或格式不支持的文件：{path}")
+            continue
+        valid.append((filename, word))
+    return valid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无界面批量把截图制作为Anki卡片")
+    parser.add_argument("folder", nargs="?", help="截图所在文件夹")
+    parser.add_argument("items", nargs="*", help="要处理的截图和单词，格式：文件名=单词")
+    parser.add_argument("--words", help="单词列表文件，每行：文件名<Tab>单词")
+    parser.add_argument("--resume", action="store_true", help="继续任务日志中所有未完成的任务（不需要指定文件夹）")
+    parser.add_argument("--batch-size", type=int, help="覆盖config.ini中的[openai] batch_size")
+    parser.add_argument("--max-workers", type=int, help="覆盖config.ini中的[openai] max_workers")
+    parser.add_argument("--compress-workers", type=int, help="覆盖config.ini中的[anki] compress_workers")
+    parser.add_argument("--trace", help="开启耗时统计并把每个阶段的记录追加写入该文件（JSON Lines）")
+    args = parser.parse_intermixed_args(argv)
+
+    jobs = []
+    if not args.resume:
+        if not args.folder:
+            parser.error("请指定截图所在文件夹，或使用 --resume 继续未完成的任务")
+        jobs = read_jobs(args.folder, args.words, args.items)
+        if not jobs:
+            parser.error("没有需要处理的截图，请通过 --words 或 文件名=单词 指定")
+
+    config = load_config()
+    metrics.configure_from_config(config)
+    if args.trace:
+        metrics.configure(True, args.trace)
+    options = openai_options(config)
+    if args.batch_size:
+        options["batch_size"] = args.batch_size
+    if args.max_workers:
+        options["max_workers"] = args.max_workers
+
+    journal = JobJournal.from_config(config)
+    if args.resume:
+        if not journal:
+            parser.error("config.ini中未启用任务日志（[journal] enabled）")
+        unfinished = journal.unfinished_jobs()
+        if not unfinished:
+            print("没有未完成的任务")
+            return 0
+
+    anki_connect = AnkiConnect()
+    if args.compress_workers:
+        anki_connect.compressor.max_workers = args.compress_workers
+    explainer = OpenAIExplanation(**options, cache=ExplanationCache.from_config(config))
+    pipeline = CardPipeline(anki_connect, explainer, journal=journal)
+    try:
+        if args.resume:
+            ok = True
+            for job in unfinished:
+                summary = pipeline.resume(job["job_id"]).result()
+                ok = ok and summary["success"] == summary["total"]
+            return 0 if ok else 1
+
+        anki_connect.folder_path = args.folder
+        filenames = [filename for filename, _ in jobs]
+        words = [word for _, word in jobs]
+
+        def on_progress(index, status):
+            print(f"[{index + 1}/{len(jobs)}] {filenames[index]}：{status}")
+
+        summary = pipeline.run(filenames, words, on_progress)
+        return 0 if summary["success"] == summary["total"] else 1
+    finally:
+        pipeline.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
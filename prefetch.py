@@ -0,0 +1,105 @@
+import asyncio
+from collections import OrderedDict
+
+
+def prefetch_options(config):
+    """从配置的[prefetch]部分读取预解析参数"""
+    return {
+        "enabled": config.getboolean("prefetch", "enabled", fallback=True),
+        "delay_ms": config.getint("prefetch", "delay_ms", fallback=800),  # 输入停顿多久后开始预解析
+        "max_concurrent": config.getint("prefetch", "max_concurrent", fallback=2),  # 同时进行的预解析数量
+        "max_entries": config.getint("prefetch", "max_entries", fallback=200)  # 内存中保留的结果数量
+    }
+
+
+class ExplanationPrefetcher:
+    """输入单词时在后台提前解析，点击"创建卡片"时直接使用结果
+
+    界面线程通过request()提交，任务在处理引擎的事件循环中运行，同时最多max_concurrent个。
+    每张截图只保留最新单词的任务，单词改变后尚未被创建卡片使用的旧任务会被取消。
+    成功的结果按 (字幕, 单词, 模式) 保存在内存中，最多max_entries条。
+    除request()和cancel_all()外，其余方法只能在事件循环中调用。
+    """
+
+    def __init__(self, explainer, loop_thread, max_concurrent=2, max_entries=200):
+        self.explainer = explainer
+        self.loop_thread = loop_thread
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_entries = max(1, int(max_entries))
+        self.results = OrderedDict()  # (字幕, 单词, 模式) -> 解析结果（LRU）
+        self.tasks = {}  # 字幕 -> (键, asyncio.Task)
+        self.claimed = set()  # 已被创建卡片等待的任务，不再取消
+        self.limit = None  # 预解析的并发上限（asyncio.Semaphore，在事件循环中创建）
+
+    def request(self, subtitle, word, mode):
+        """提交预解析（可在任意线程调用）"""
+        self.loop_thread.loop.call_soon_threadsafe(self._start, (subtitle, word, mode))
+
+    def cancel_all(self):
+        """取消全部未被使用的预解析（如切换文件夹时），可在任意线程调用"""
+        self.loop_thread.loop.call_soon_threadsafe(self._cancel_all)
+
+    def _start(self, key):
+        if key in self.results:
+            self.results.move_to_end(key)
+            return
+        current = self.tasks.get(key[0])
+        if current is not None:
+            if current[0] == key:
+                return
+            self._cancel(key[0])
+        self.tasks[key[0]] = (key, asyncio.ensure_future(self._run(key)))
+
+    def _cancel(self, subtitle):
+        key, task = self.tasks.pop(subtitle)
+        if task not in self.claimed and not task.done():
+            task.cancel()
+            print(f"取消过期的预解析：{key[1]}")
+
+    def _cancel_all(self):
+        for subtitle in list(self.tasks):
+            self._cancel(subtitle)
+
+    async def _run(self, key):
+        if self.limit is None:
+            self.limit = asyncio.Semaphore(self.max_concurrent)
+        task = asyncio.current_task()
+        try:
+            async with self.limit:
+                print(f"预解析单词：{key[1]}")
+                result = await self.explainer.explain_single(*key)
+            if not result.get("error"):
+                self.results[key] = result
+                while len(self.results) > self.max_entries:
+                    self.results.popitem(last=False)
+            return result
+        finally:
+            if self.tasks.get(key[0], (None, None))[1] is task:
+                del self.tasks[key[0]]
+            self.claimed.discard(task)
+
+    def has(self, subtitle, word, mode):
+        """是否有该单词已完成或正在进行的预解析"""
+        key = (subtitle, word, mode)
+        entry = self.tasks.get(subtitle)
+        return key in self.results or (entry is not None and entry[0] == key)
+
+    async def get(self, subtitle, word, mode):
+        """取出预解析结果：已完成的直接返回，进行中的等待其完成；没有或解析失败时返回None"""
+        key = (subtitle, word, mode)
+        if key in self.results:
+            return self.results[key]
+        entry = self.tasks.get(subtitle)
+        if entry is None or entry[0] != key:
+            return None
+        task = entry[1]
+        self.claimed.add(task)
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        except Exception:
+            return None
+        return result if not result.get("error") else None
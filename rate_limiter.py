@@ -0,0 +1,203 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import openai
+
+# 表示服务端限流或过载的状态码：除重试外还会降低并发数
+THROTTLE_STATUS = (429, 503, 529)
+# 可以原样重试的其余状态码
+RETRY_STATUS = (408, 409, 500, 502, 504)
+
+
+class TokenBucket:
+    """令牌桶：每分钟补充per_minute个令牌，容量为一分钟的额度；per_minute不大于0时不限制"""
+
+    def __init__(self, per_minute):
+        self.rate = max(0.0, float(per_minute)) / 60
+        self.capacity = max(0.0, float(per_minute))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """取出amount个令牌，不足时等待补充（超过容量的请求在桶满时放行）"""
+        if not self.rate:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, amount):
+        """按实际用量修正预估值：amount为正时补扣，为负时退还"""
+        if not self.rate:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AdaptiveConcurrency:
+    """加性增、乘性减（AIMD）的并发上限
+
+    每个请求成功后上限增加1/上限（约每完成一轮并发增加1），被限流时减半；
+    同一轮中先后返回的多个限流响应只减半一次。只在处理引擎的事件循环中使用。
+    """
+
+    def __init__(self, initial, maximum, minimum=1):
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.limit = float(min(self.maximum, max(self.minimum, int(initial))))
+        self.active = 0
+        self.last_decrease = 0.0
+        self.waiters = []
+
+    async def acquire(self):
+        """等待空闲名额，返回开始时间（供release判断限流响应属于哪一轮）"""
+        while self.active >= int(self.limit):
+            waiter = asyncio.get_event_loop().create_future()
+            self.waiters.append(waiter)
+            await waiter
+        self.active += 1
+        return time.monotonic()
+
+    def release(self, started, outcome):
+        """归还名额；outcome为"ok"、"throttled"或其他（如失败、取消，不调整上限）"""
+        self.active -= 1
+        if outcome == "ok":
+            self.limit = min(self.maximum, self.limit + 1 / int(self.limit))
+        elif outcome == "throttled" and started >= self.last_decrease:
+            self.limit = max(self.minimum, self.limit / 2)
+            self.last_decrease = time.monotonic()
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class _Slot:
+    """一次大模型请求占用的名额：进入时等待并发、请求数和token额度，退出时按结果调整并发上限"""
+
+    def __init__(self, limiter, tokens):
+        self.limiter = limiter
+        self.estimated = tokens
+        self.actual = None
+        self.started = None
+
+    def record_usage(self, usage):
+        """记录响应中的实际token用量，用于修正预估值"""
+        total = getattr(usage, "total_tokens", None) if usage else None
+        if total:
+            self.actual = total
+
+    async def __aenter__(self):
+        limiter = self.limiter
+        await limiter.wait_cooldown()
+        self.started = await limiter.concurrency.acquire()
+        try:
+            await limiter.requests.acquire(1)
+            await limiter.tokens.acquire(self.estimated)
+        except BaseException:
+            limiter.concurrency.release(self.started, "cancelled")
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        limiter = self.limiter
+        if self.actual is not None:
+            limiter.tokens.adjust(self.actual - self.estimated)
+        if exc is None:
+            outcome = "ok"
+        elif status_code(exc) in THROTTLE_STATUS:
+            outcome = "throttled"
+        else:
+            outcome = "failed"
+        limiter.concurrency.release(self.started, outcome)
+        return False
+
+
+def status_code(error):
+    return getattr(error, "status_code", None)
+
+
+def retry_after(error):
+    """从响应头的Retry-After（秒或HTTP日期）或retry-after-ms中读取服务端要求的等待秒数"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """大模型请求的客户端调度：请求数和token两个令牌桶、AIMD并发上限、带抖动的指数退避重试"""
+
+    def __init__(self, max_workers=4, max_concurrency=None, requests_per_minute=0, tokens_per_minute=0,
+                 max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.concurrency = AdaptiveConcurrency(max_workers, max_concurrency or max_workers)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.cooldown_until = 0.0  # 收到Retry-After后所有请求暂停到该时刻
+
+    @property
+    def track_tokens(self):
+        """是否需要响应中的token用量来修正token桶"""
+        return bool(self.tokens.rate)
+
+    def slot(self, tokens):
+        return _Slot(self, tokens)
+
+    async def wait_cooldown(self):
+        while True:
+            remaining = self.cooldown_until - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    def retry_delay(self, attempt, error):
+        """返回第attempt次（从0开始）失败后应等待的秒数，不应重试时返回None"""
+        if attempt >= self.max_retries:
+            return None
+        status = status_code(error)
+        if status == 429 and getattr(error, "code", None) == "insufficient_quota":
+            return None  # 余额不足，重试也不会成功
+        if not (isinstance(error, openai.APIConnectionError) or status in THROTTLE_STATUS + RETRY_STATUS):
+            return None
+
+        wait = retry_after(error)
+        if wait is not None:
+            # 在服务端要求的时间上略加抖动，避免同时被限流的请求在同一时刻重试
+            delay = min(self.max_delay, wait * random.uniform(1.0, 1.2))
+        else:
+            # 全抖动：在[0, 指数上限]内随机等待，避免并发请求同时重试
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if status in THROTTLE_STATUS:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + delay)
+        return delay
@@ -0,0 +1,335 @@
+import os
+import queue
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import ttk
+from PIL import ImageTk
+
+ROW_HEIGHT = 112  # 每行固定高度（100像素缩略图+上下边距）
+PHOTO_CACHE_SIZE = 200  # 最多保留的PhotoImage数量，超出后释放最久未显示的
+POLL_INTERVAL = 30  # 主线程轮询后台结果的间隔（毫秒）
+THUMBNAILS_PER_POLL = 20  # 每次轮询最多创建的PhotoImage数量，避免长时间阻塞界面
+
+
+class ScreenshotRow:
+    """截图列表中一行的数据：勾选状态、输入的单词和按钮状态，独立于界面组件保存"""
+
+    def __init__(self, folder_path, filename):
+        self.filename = filename
+        self.img_path = os.path.join(folder_path, filename)
+        self.checked = False
+        self.word = ""
+        self.button_options = {}  # 相对默认按钮样式的修改（text/state/bg）
+
+
+class RowButton:
+    """代替真实按钮交给AnkiConnect使用
+
+    config()只修改数据模型中的按钮状态，再通知主线程刷新当前显示该行的组件，
+    因此行组件在滚动时被复用也不会显示错乱，且可以在工作线程中调用。
+    """
+
+    def __init__(self, grid, row):
+        self.grid = grid
+        self.row = row
+
+    def config(self, **kwargs):
+        self.row.button_options.update(kwargs)
+        self.grid.request_refresh(self.row)
+
+
+class RowView:
+    """一组可复用的行组件，滚动时绑定到不同的ScreenshotRow"""
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.row = None
+        self.index = None
+
+        self.frame = ttk.Frame(grid.canvas)
+        for i in range(5):
+            self.frame.columnconfigure(i, weight=1, uniform="cols")
+
+        # 确认框列
+        self.check_var = tk.BooleanVar()
+        self.check_btn = ttk.Checkbutton(self.frame, variable=self.check_var, command=self._on_check)
+        self.check_btn.grid(row=0, column=0, sticky="", padx=5, pady=5)
+
+        # 图片列（点击打开原图）
+        self.img_label = ttk.Label(self.frame, anchor="center")
+        self.img_label.bind("<Button-1>", self._on_image_click)
+        self.img_label.grid(row=0, column=1, sticky="nsew", padx=5, pady=5)
+
+        # 文件名列：可换行、可选中的只读Text组件
+        self.text_widget = tk.Text(
+            self.frame,
+            wrap="word",  # 按单词自动换行
+            width=20,      # 宽度（约20个字符）
+            height=3,      # 高度（最多3行）
+            state="disabled",  # 只读状态
+            bg="systembuttonface",  # 背景色与系统按钮一致
+            bd=0,          # 无边框
+            font=ttk.Style().lookup("TLabel", "font")  # 继承Label字体
+        )
+        self.text_widget.grid(row=0, column=2, sticky="nsew", padx=5, pady=5)
+
+        # 单词输入列：输入内容实时写回数据模型
+        self.word_var = tk.StringVar()
+        self.word_var.trace_add("write", self._on_word_change)
+        self.input_entry = ttk.Entry(self.frame, textvariable=self.word_var)
+        self.input_entry.grid(row=0, column=3, sticky="ew", padx=5, pady=5)
+
+        # 操作列
+        self.action_btn = tk.Button(self.frame, text="创建卡片", state="normal", command=self._on_click)
+        self.action_btn.grid(row=0, column=4, sticky="ew", padx=5, pady=5)
+        self.default_button_options = {"text": "创建卡片", "state": "normal", "bg": self.action_btn.cget("bg")}
+
+        # 鼠标位于行组件上时滚轮同样滚动整个列表
+        for widget in (self.frame, self.check_btn, self.img_label, self.text_widget, self.input_entry, self.action_btn):
+            grid.bind_scroll(widget)
+
+        self.window_id = grid.canvas.create_window(0, 0, window=self.frame, anchor=tk.NW, height=ROW_HEIGHT)
+
+    def bind(self, index, row):
+        """把组件绑定到第index行数据并刷新显示"""
+        if self.grid.root.focus_get() is self.input_entry:
+            self.grid.canvas.focus_set()  # 避免继续输入的内容写到新绑定的行
+        self.row = None  # 绑定期间修改组件状态时不回写数据模型
+        self.index = index
+
+        self.check_var.set(row.checked)
+        self.word_var.set(row.word)
+
+        self.text_widget.config(state="normal")
+        self.text_widget.delete("1.0", tk.END)
+        self.text_widget.insert("1.0", os.path.splitext(row.filename)[0])  # 去除文件名后缀
+        self.text_widget.config(state="disabled")
+
+        self.row = row
+        self.update_image()
+        self.update_button()
+
+    def unbind(self):
+        self.row = None
+        self.index = None
+
+    def update_image(self):
+        photo = self.grid.get_photo(self.row)
+        if photo is not None:
+            self.img_label.config(image=photo, text="")
+            self.img_label.image = photo
+        else:
+            # 后台解码完成前先显示占位文字，行内其他组件可立即使用
+            placeholder = "无法加载" if self.row.img_path in self.grid.failed else "加载中…"
+            self.img_label.config(image="", text=placeholder)
+            self.img_label.image = None
+
+    def update_button(self):
+        options = dict(self.default_button_options)
+        options.update(self.row.button_options)
+        self.action_btn.config(**options)
+
+    def _on_check(self):
+        if self.row is not None:
+            self.row.checked = self.check_var.get()
+
+    def _on_word_change(self, *args):
+        if self.row is not None:
+            self.row.word = self.word_var.get()
+            if self.grid.on_word_change:
+                self.grid.on_word_change(self.row)
+
+    def _on_image_click(self, event):
+        if self.row is not None:
+            self.grid.on_open_image(self.row.img_path)
+
+    def _on_click(self):
+        if self.row is not None:
+            self.grid.on_create(self.row, self.grid.button(self.row))
+
+
+class ScreenshotGrid:
+    """虚拟化的截图列表：只为可见区域创建行组件，滚动时复用，勾选和输入状态保存在ScreenshotRow中"""
+
+    def __init__(self, root, thumbnail_loader, on_create, on_open_image, decode_workers=4, on_word_change=None):
+        self.root = root
+        self.thumbnail_loader = thumbnail_loader  # 图片路径 -> PIL缩略图
+        self.on_create = on_create  # 点击"创建卡片"：on_create(row, button)
+        self.on_open_image = on_open_image
+        self.on_word_change = on_word_change  # 用户修改某行的单词：on_word_change(row)
+        self.rows = []
+        self.views = []
+        self.bound = {}  # 行号 -> 当前显示该行的RowView
+        self.photos = OrderedDict()  # 图片路径 -> PhotoImage（LRU）
+        self.refresh_queue = queue.Queue()  # 工作线程请求刷新的行
+        # 缩略图在后台线程池解码，完成后经队列交给主线程创建PhotoImage
+        self.decoder = ThreadPoolExecutor(max_workers=decode_workers)
+        self.thumbnail_queue = queue.Queue()
+        self.pending = set()  # 已提交解码、尚未完成的图片路径
+        self.failed = set()  # 解码失败的图片路径
+        self.visible_paths = set()  # 当前可见行的图片路径（供后台线程判断是否仍需解码）
+
+        self.container = ttk.Frame(root)
+        self.container.columnconfigure(0, weight=1)
+        self.container.rowconfigure(1, weight=1)
+
+        # 标题行固定在列表上方，不随滚动移动
+        self.header = ttk.Frame(self.container)
+        for text, col in [("确认框", 0), ("图片", 1), ("文件名", 2), ("单词", 3), ("操作", 4)]:
+            self.header.columnconfigure(col, weight=1, uniform="cols")
+            title_label = ttk.Label(
+                self.header,
+                text=text,
+                font=('微软雅黑', 10, 'bold'),  # 加粗字体更醒目
+                anchor="center"  # 文字居中显示
+            )
+            title_label.grid(row=0, column=col, sticky="nsew", padx=5, pady=5)
+        self.header.grid(row=0, column=0, sticky="ew")
+
+        self.canvas = tk.Canvas(self.container, yscrollincrement=ROW_HEIGHT // 4)
+        self.scrollbar = ttk.Scrollbar(self.container, orient=tk.VERTICAL, command=self.yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.grid(row=1, column=0, sticky="nsew")
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.bind_scroll(self.canvas)
+
+        self.root.after(POLL_INTERVAL, self._poll)
+
+    def pack(self, **kwargs):
+        self.container.pack(**kwargs)
+
+    def set_rows(self, rows):
+        """替换全部行数据并滚动到顶部"""
+        self.rows = list(rows)
+        for view in self.views:
+            view.unbind()
+        self.bound = {}
+        self.photos.clear()
+        self.failed.clear()
+        self.canvas.yview_moveto(0)
+        self.refresh()
+
+    def append_rows(self, rows):
+        """在末尾追加行，已有行的组件和缩略图保持不变"""
+        self.rows.extend(rows)
+        self.refresh()
+
+    def button(self, row):
+        return RowButton(self, row)
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def bind_scroll(self, widget):
+        widget.bind("<MouseWheel>", lambda event: self._scroll(-3 if event.delta > 0 else 3))
+        widget.bind("<Button-4>", lambda event: self._scroll(-3))
+        widget.bind("<Button-5>", lambda event: self._scroll(3))
+
+    def _scroll(self, units):
+        self.canvas.yview_scroll(units, "units")
+        self.refresh()
+        return "break"  # 阻止Text等组件自身的滚轮处理
+
+    def refresh(self):
+        """根据当前滚动位置重新分配行组件，只有新进入可见区域的行需要重新绑定"""
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        self.canvas.configure(scrollregion=(0, 0, width, len(self.rows) * ROW_HEIGHT))
+
+        top = self.canvas.canvasy(0)
+        first = max(0, int(top // ROW_HEIGHT))
+        last = min(len(self.rows), first + int(height // ROW_HEIGHT) + 2)
+        visible = range(first, last)
+        self.visible_paths = {self.rows[index].img_path for index in visible}
+
+        # 回收离开可见区域的组件
+        free = []
+        for index in list(self.bound):
+            if index not in visible:
+                view = self.bound.pop(index)
+                view.unbind()
+                free.append(view)
+        free.extend(view for view in self.views if view.index is None and view not in free)
+
+        for index in visible:
+            view = self.bound.get(index)
+            if view is None:
+                if free:
+                    view = free.pop()
+                else:
+                    view = RowView(self)
+                    self.views.append(view)
+                view.bind(index, self.rows[index])
+                self.bound[index] = view
+            self.canvas.coords(view.window_id, 0, index * ROW_HEIGHT)
+            self.canvas.itemconfig(view.window_id, width=width, state="normal")
+
+        for view in free:
+            self.canvas.itemconfig(view.window_id, state="hidden")
+
+    def redraw(self):
+        """数据模型被批量修改后（如全选）刷新所有可见行"""
+        for index, view in self.bound.items():
+            view.bind(index, self.rows[index])
+
+    def get_photo(self, row):
+        """返回行对应的缩略图PhotoImage；尚未解码时提交后台解码并返回None"""
+        photo = self.photos.get(row.img_path)
+        if photo is not None:
+            self.photos.move_to_end(row.img_path)
+            return photo
+        if row.img_path not in self.pending and row.img_path not in self.failed:
+            self.pending.add(row.img_path)
+            self.decoder.submit(self._decode, row.img_path)
+        return None
+
+    def _decode(self, img_path):
+        """在后台线程解码缩略图（PhotoImage只能在主线程创建，这里只产出PIL图片）"""
+        if img_path not in self.visible_paths:
+            # 解码前已滚出可见区域，放弃本次解码，重新可见时再提交
+            self.thumbnail_queue.put((img_path, None, None))
+            return
+        try:
+            self.thumbnail_queue.put((img_path, self.thumbnail_loader(img_path), None))
+        except Exception as e:
+            self.thumbnail_queue.put((img_path, None, e))
+
+    def request_refresh(self, row):
+        """可在任意线程调用，由主线程在下一次轮询时刷新该行的按钮"""
+        self.refresh_queue.put(row)
+
+    def _poll(self):
+        """主线程定时轮询：刷新按钮状态，并把后台解码完成的缩略图分批交给Tk"""
+        try:
+            while True:
+                row = self.refresh_queue.get_nowait()
+                for view in self.bound.values():
+                    if view.row is row:
+                        view.update_button()
+        except queue.Empty:
+            pass
+
+        for _ in range(THUMBNAILS_PER_POLL):
+            try:
+                img_path, image, error = self.thumbnail_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(img_path)
+            if error is not None:
+                print(f"无法加载图片: {img_path} - {error}")
+                self.failed.add(img_path)
+            elif image is not None:
+                self.photos[img_path] = ImageTk.PhotoImage(image)
+                while len(self.photos) > PHOTO_CACHE_SIZE:
+                    self.photos.popitem(last=False)
+            # image和error都为None表示解码时该行不可见而被跳过；若该行此时已重新可见，
+            # update_image()会通过get_photo()重新提交解码
+            for view in self.bound.values():
+                if view.row is not None and view.row.img_path == img_path:
+                    view.update_image()
+
+        self.root.after(POLL_INTERVAL, self._poll)
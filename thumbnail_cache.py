@@ -0,0 +1,47 @@
+import hashlib
+import os
+from PIL import Image
+
+
+class ThumbnailCache:
+    """磁盘缩略图缓存：以 图片路径+缩略图尺寸+修改时间 为键，每张缩略图存为一个小PNG文件"""
+
+    def __init__(self, cache_dir, size=(100, 100)):
+        self.cache_dir = cache_dir
+        self.size = tuple(size)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, img_path):
+        stat = os.stat(img_path)
+        raw = f"{os.path.abspath(img_path)}|{self.size[0]}x{self.size[1]}|{stat.st_mtime_ns}|{stat.st_size}"
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        # 按哈希前两位分子目录，避免单个目录下文件过多
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.png")
+
+    def load(self, img_path):
+        """返回图片的缩略图（PIL Image），优先读取缓存，未命中时生成并写入缓存"""
+        cache_path = self._cache_path(img_path)
+        if os.path.exists(cache_path):
+            try:
+                with Image.open(cache_path) as cached:
+                    cached.load()
+                    return cached.copy()
+            except Exception as e:
+                print(f"缩略图缓存损坏，重新生成: {cache_path} - {e}")
+
+        with Image.open(img_path) as img:
+            # JPEG可直接以1/2、1/4、1/8分辨率解码，大幅减少首次生成缩略图时的解码量
+            img.draft("RGB", self.size)
+            img.thumbnail(self.size)
+            thumb = img.copy()
+        if thumb.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+            thumb = thumb.convert("RGB")  # 如CMYK等PNG不支持的模式
+
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            thumb.save(tmp_path, format="PNG")
+            os.replace(tmp_path, cache_path)  # 先写临时文件再替换，避免留下不完整的缓存
+        except Exception as e:
+            print(f"写入缩略图缓存失败: {cache_path} - {e}")
+        return thumb